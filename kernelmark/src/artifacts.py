@@ -0,0 +1,261 @@
+# artifacts
+#   Content-addressed store for build artifacts. Images are stored once by hash and hardlinked
+#   (or reflinked/copied if that fails) into out_dir/<machine>/<kernel>/. The rootfs is stored
+#   file by file instead: every build's differs (timestamps, modules), but almost everything in
+#   it is shared between kernels. It is only written out while it's needed (see checkout). Each
+#   kernel directory gets a manifest recording the hash of the config it was built from, so a
+#   build is only reused when its inputs really match.
+# 10/2026
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import build
+
+MANIFEST = "artifacts.json"
+CHUNK_SZ = 1 << 20
+ARCHIVES = ["rootfs.cpio"]  # stored by member, see put_cpio
+
+# newc cpio format
+CPIO_MAGIC = [b"070701", b"070702"]
+CPIO_HEADER = 110
+CPIO_TRAILER = b"TRAILER!!!"
+
+
+def input_hash(machine, kernel_ver):
+    """
+    Hash of the full Buildroot config used to build kernel_ver for machine.
+    """
+    h = hashlib.sha256()
+    with open(f"{build.br_conf_dir}/{machine.name}.config", "rb") as f:
+        h.update(f.read())
+    config = io.StringIO()
+    build.write_kernel_config(kernel_ver, config)
+    h.update(config.getvalue().encode())
+    return h.hexdigest()
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SZ)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def blob_path(digest):
+    return f"{build.store_dir}/blobs/{digest[:2]}/{digest[2:]}"
+
+
+def add_blob(digest, write):
+    """
+    Store a blob under digest unless it's already there. write(f) writes its contents to f.
+    Several builds may be storing the same blob at once, so each writes to a file of its own first.
+    """
+    blob = blob_path(digest)
+    if os.path.exists(blob):
+        return
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(blob), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.chmod(tmp, 0o444)    # shared between kernels - never modify in place
+        os.rename(tmp, blob)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def put(path):
+    """
+    Add a file to the store. Returns its hash.
+    """
+    digest = file_hash(path)
+    def write(f):
+        with open(path, "rb") as src:
+            shutil.copyfileobj(src, f, CHUNK_SZ)
+    add_blob(digest, write)
+    return digest
+
+
+def put_data(data):
+    digest = hashlib.sha256(data).hexdigest()
+    add_blob(digest, lambda f: f.write(data))
+    return digest
+
+
+def pad4(n):
+    return (n + 3) & ~3
+
+
+def put_cpio(path):
+    """
+    Add a newc cpio archive (as Buildroot makes rootfs.cpio) to the store member by member, so
+    that contents it shares with other archives are only stored once. The headers and names all go
+    in one blob of their own. Returns the hashes of that and of each member's contents, in order,
+    or None if the archive can't be stored this way.
+    """
+    headers = io.BytesIO()
+    members = []
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(CPIO_HEADER)
+            if len(header) != CPIO_HEADER or header[:6] not in CPIO_MAGIC:
+                return None
+            size = int(header[54:62], 16)
+            namesize = int(header[94:102], 16)
+            name = f.read(pad4(CPIO_HEADER + namesize) - CPIO_HEADER)
+            headers.write(header + name)
+            if name[:namesize - 1] == CPIO_TRAILER:
+                # along with the padding after it
+                headers.write(f.read())
+                break
+            data = f.read(size)
+            f.read(pad4(size) - size)
+            members.append(put_data(data))
+    return [put_data(headers.getvalue())] + members
+
+
+def write_cpio(blobs, f):
+    """
+    Write out an archive stored by put_cpio to f.
+    """
+    with open(blob_path(blobs[0]), "rb") as headers:
+        for digest in blobs[1:] + [None]:
+            header = headers.read(CPIO_HEADER)
+            namesize = int(header[94:102], 16)
+            f.write(header + headers.read(pad4(CPIO_HEADER + namesize) - CPIO_HEADER))
+            if digest is None:
+                f.write(headers.read())
+                return
+            size = int(header[54:62], 16)
+            with open(blob_path(digest), "rb") as data:
+                shutil.copyfileobj(data, f, CHUNK_SZ)
+            f.write(b"\0" * (pad4(size) - size))
+
+
+def link(digest, dest):
+    """
+    Place a stored blob at dest. Hardlink if possible, otherwise reflink or copy.
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(blob_path(digest), dest)
+    except OSError:
+        if os.system(f"cp --reflink=auto {blob_path(digest)} {dest}"):
+            shutil.copyfile(blob_path(digest), dest)
+
+
+def store(machine, kernel_ver, files):
+    """
+    Store build outputs (dict of name -> path) for a kernel and write its manifest.
+    """
+    kernel_dir = f"{build.out_dir}/{machine.name}/{kernel_ver}"
+    manifest = {
+        "inputs" : input_hash(machine, kernel_ver),
+        "files" : {},
+        "archives" : {}
+    }
+    for name, path in files.items():
+        manifest["files"][name] = file_hash(path)
+        blobs = None
+        if name in ARCHIVES:
+            blobs = put_cpio(path)
+        if blobs is not None and unpacked(blobs) == manifest["files"][name]:
+            # written out when needed
+            manifest["archives"][name] = blobs
+            if os.path.lexists(f"{kernel_dir}/{name}"):
+                os.remove(f"{kernel_dir}/{name}")
+            continue
+        put(path)
+        link(manifest["files"][name], f"{kernel_dir}/{name}")
+
+    with open(f"{kernel_dir}/{MANIFEST}.tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.rename(f"{kernel_dir}/{MANIFEST}.tmp", f"{kernel_dir}/{MANIFEST}")
+
+
+def built(machine, kernel_ver):
+    """
+    True if the kernel directory has a manifest for the current inputs and all its files are present.
+    """
+    kernel_dir = f"{build.out_dir}/{machine.name}/{kernel_ver}"
+    try:
+        with open(f"{kernel_dir}/{MANIFEST}") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if manifest.get("inputs") != input_hash(machine, kernel_ver):
+        return False
+
+    archives = manifest.get("archives", {})
+    for name, digest in manifest["files"].items():
+        if name in archives:
+            if not all(os.path.exists(blob_path(b)) for b in archives[name]):
+                return False
+            continue
+        path = f"{kernel_dir}/{name}"
+        if not os.path.exists(path) or not os.path.exists(blob_path(digest)):
+            return False
+        if os.path.getsize(path) != os.path.getsize(blob_path(digest)):
+            return False
+    return True
+
+
+class HashWriter():
+    """
+    File-like object which only hashes what's written to it.
+    """
+    def __init__(self):
+        self.h = hashlib.sha256()
+
+    def write(self, data):
+        self.h.update(data)
+
+
+def unpacked(blobs):
+    """
+    Hash of an archive stored by put_cpio as it would be written out.
+    """
+    f = HashWriter()
+    write_cpio(blobs, f)
+    return f.h.hexdigest()
+
+
+@contextlib.contextmanager
+def checkout(machine, kernel_ver):
+    """
+    Write out a kernel's archives into its output directory for as long as they're needed, e.g.
+    to deploy it. Kernels stored before archives were split up already have them in place.
+    """
+    kernel_dir = f"{build.out_dir}/{machine.name}/{kernel_ver}"
+    try:
+        with open(f"{kernel_dir}/{MANIFEST}") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    written = []
+    try:
+        for name, blobs in manifest.get("archives", {}).items():
+            dest = f"{kernel_dir}/{name}"
+            with open(dest, "wb") as f:
+                written.append(dest)
+                write_cpio(blobs, f)
+            if file_hash(dest) != manifest["files"][name]:
+                print(f"WARNING: {dest} doesn't match what was built")
+        yield
+    finally:
+        for path in written:
+            os.remove(path)
@@ -0,0 +1,130 @@
+# brcache
+#   Cache of Buildroot toolchain, host tools and rootfs between kernel builds. Everything in a
+#   Buildroot output directory except the kernel itself only depends on the machine's BR config
+#   and the kernel header selection, so a build for a new kernel can start from a saved tree and
+#   only rebuild the linux package.
+# 10/2026
+
+import hashlib
+import io
+import os
+import shutil
+
+import build
+import ccache
+
+STAMP = ".kernelmark-cache"
+
+
+def cache_key(machine, kernel_ver, output_dir):
+    """
+    Hash of everything that the non-kernel parts of a build depend on. Buildroot host tools are not
+    relocatable, so the output directory is part of the key.
+    """
+    h = hashlib.sha256()
+    with open(f"{build.br_conf_dir}/{machine.name}.config", "rb") as f:
+        h.update(f.read())
+
+    headers = io.StringIO()
+    build.write_kernel_headers(kernel_ver, headers)
+    for line in headers.getvalue().splitlines():
+        # This one tracks the kernel version rather than the headers
+        if line.startswith("BR2_DEFAULT_KERNEL_VERSION="):
+            continue
+        h.update(line.encode())
+
+    # The toolchain wrapper is built differently with ccache
+    options = io.StringIO()
+    ccache.write_config(options)
+    h.update(options.getvalue().encode())
+
+    h.update(os.path.realpath(output_dir).encode())
+    return h.hexdigest()
+
+
+def enabled():
+    return build.cache_dir is not None
+
+
+def entry(key):
+    return f"{build.cache_dir}/{key}"
+
+
+def current_key(output_dir):
+    """
+    Key of the tree currently in output_dir, or None if it is unknown.
+    """
+    try:
+        with open(f"{output_dir}/{STAMP}") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def fresh(output_dir):
+    """
+    True if nothing has been built in output_dir yet (or it has been cleaned), so whatever is
+    built there next is built for the current config.
+    """
+    return not any(os.path.exists(f"{output_dir}/{d}") for d in ["build", "host", "target"])
+
+
+def set_key(output_dir, key):
+    """
+    Record which cache key the tree in output_dir matches. None marks it as unknown.
+    """
+    if key is None:
+        if os.path.exists(f"{output_dir}/{STAMP}"):
+            os.remove(f"{output_dir}/{STAMP}")
+        return
+    with open(f"{output_dir}/{STAMP}", "w") as f:
+        f.write(key)
+
+
+def restore(key, output_dir):
+    """
+    Replace the contents of output_dir with a cached tree. Returns True if there was one to restore.
+    """
+    if not os.path.exists(entry(key)):
+        return False
+
+    print(f"Restoring cached toolchain and rootfs {key[:12]} into {output_dir}")
+    os.makedirs(output_dir, exist_ok=True)
+    for name in os.listdir(output_dir):
+        # Keep the config for this build (lives here when building with O=)
+        if name == ".config":
+            continue
+        path = f"{output_dir}/{name}"
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    shutil.copytree(entry(key), output_dir, symlinks=True, dirs_exist_ok=True)
+    set_key(output_dir, key)
+    return True
+
+
+def save(key, output_dir):
+    """
+    Save everything in output_dir except the kernel and images into the cache.
+    """
+    if os.path.exists(entry(key)):
+        return
+
+    def ignore(path, names):
+        rel = os.path.relpath(path, output_dir)
+        skip = []
+        for name in names:
+            if rel == "." and name in ["images", ".config", ".config.old", STAMP]:
+                skip.append(name)
+            elif rel == "build" and name.startswith("linux-") and not name.startswith("linux-headers"):
+                skip.append(name)
+            elif rel == os.path.join("target", "lib") and name == "modules":
+                skip.append(name)
+        return skip
+
+    print(f"Saving toolchain and rootfs {key[:12]} to cache")
+    os.makedirs(build.cache_dir, exist_ok=True)
+    shutil.copytree(output_dir, f"{entry(key)}.tmp", symlinks=True, ignore=ignore, dirs_exist_ok=True)
+    os.rename(f"{entry(key)}.tmp", entry(key))
@@ -4,13 +4,22 @@
 # 12/2022
 
 import json
+import glob
 import shutil
 import machine
 import os
+import brcache
+import artifacts
+import ccache
 from error import *
 
 
-def build(machine, kernel_ver, clean):
+def build(machine, kernel_ver, clean, build_dir=None, jobs=None):
+    """
+    Build a kernel with Buildroot. By default this uses the Buildroot tree itself, but build_dir
+    can be used to build in a separate output directory (O=) so that several builds can run at once.
+    jobs overrides BR2_JLEVEL for this build.
+    """
     # Check if this kernel version has already been built
     if kernel_built(machine, kernel_ver):
         print(f"Kernel version {kernel_ver} already built for {machine.name}.")
@@ -18,42 +27,91 @@ def build(machine, kernel_ver, clean):
     else:
         # Create output directory
         if not os.path.exists(f"{out_dir}/{machine.name}"):
-            os.mkdir(f"{out_dir}/{machine.name}/")
+            os.makedirs(f"{out_dir}/{machine.name}/", exist_ok=True)
         # Create kernel version directory
         if not os.path.exists(f"{out_dir}/{machine.name}/{kernel_ver}"):
             os.mkdir(f"{out_dir}/{machine.name}/{kernel_ver}")
 
+    # Select Buildroot output location. With O= Buildroot keeps .config and images in the output dir.
+    if build_dir is None:
+        config_dir = br_dir
+        output_dir = f"{br_dir}/output"
+        make = f"make -C {br_dir}"
+    else:
+        os.makedirs(build_dir, exist_ok=True)
+        config_dir = build_dir
+        output_dir = build_dir
+        make = f"make -C {br_dir} O={build_dir}"
+    images_dir = f"{output_dir}/images"
+    if jobs:
+        make += f" BR2_JLEVEL={jobs}"
+
     # Load buildroot configuration
     if os.path.exists(f"{br_conf_dir}/{machine.name}/.config"):
-        os.remove(f"{br_dir}/.config")
-    os.system(f"cp {br_conf_dir}/{machine.name}.config {br_dir}/.config")
+        os.remove(f"{config_dir}/.config")
+    os.system(f"cp {br_conf_dir}/{machine.name}.config {config_dir}/.config")
 
     print("No existing kernel build found for this version. Building.")
-    
 
+    with open(f"{config_dir}/.config", "a") as f:
+        write_kernel_config(kernel_ver, f)
+        ccache.write_config(f)
 
     # Invoke kernel build
-    os.chdir(f"{br_dir}/")
-
-    
-    with open(".config", "a") as f:
-        # Change kernel version
-        f.write(f"BR2_LINUX_KERNEL_CUSTOM_VERSION_VALUE=\"{kernel_ver}\"\n")
-        f.write(f"BR2_LINUX_KERNEL_VERSION=\"{kernel_ver}\"\n")
-
-        # Set kernel headers
-        write_kernel_headers(kernel_ver, f)
-
     if clean:
-        os.system("make clean")
-    if os.system(f"make > {out_dir}/{machine.name}/{kernel_ver}/build.log"):
-        os.chdir(script_dir)
+        os.system(f"{make} clean")
+        brcache.set_key(output_dir, None)
+
+    # If the tree was last built with the same toolchain/rootfs config (or a cached one matches), only
+    # the kernel has changed. The tree is only marked with its key if we know it was built for it
+    # (Buildroot won't rebuild on header changes) - it was already, or is being built from scratch.
+    key = brcache.cache_key(machine, kernel_ver, output_dir)
+    kernel_only = brcache.current_key(output_dir) == key
+    if not kernel_only and brcache.enabled():
+        kernel_only = brcache.restore(key, output_dir)
+    consistent = kernel_only or brcache.fresh(output_dir)
+    brcache.set_key(output_dir, None)
+
+    # Compiler cache stats are collected per build and written next to build.log
+    kernel_dir = f"{out_dir}/{machine.name}/{kernel_ver}"
+    if ccache.enabled():
+        statslog = f"{kernel_dir}/ccache-stats.log"
+        before = ccache.stats(output_dir)
+        make = ccache.prepare(output_dir, statslog) + make
+
+    # Fast path - rebuild just the kernel and repack the rootfs. Fall back to a full make on failure.
+    if kernel_only:
+        print("Toolchain and rootfs are up to date. Rebuilding kernel only.")
+        # Modules of the kernels built here before would be packed into this kernel's rootfs too.
+        # linux-rebuild installs this kernel's again.
+        shutil.rmtree(f"{output_dir}/target/lib/modules", ignore_errors=True)
+        status = os.system(f"{make} linux-rebuild > {kernel_dir}/build.log && \
+            {make} rootfs-cpio >> {kernel_dir}/build.log")
+        if status:
+            print("Kernel only rebuild failed. Falling back to full build.")
+            status = os.system(f"{make} >> {kernel_dir}/build.log")
+    else:
+        status = os.system(f"{make} > {kernel_dir}/build.log")
+
+    if ccache.enabled():
+        ccache.report(output_dir, statslog, before, f"{kernel_dir}/ccache.log")
+    if status:
         return ERR_B_BUILDROOT_DIED
 
-    os.system(f"cp output/images/*Image {out_dir}/{machine.name}/{kernel_ver}/Image")
-    os.system(f"cp output/images/rootfs.cpio {out_dir}/{machine.name}/{kernel_ver}/rootfs.cpio")
+    if consistent:
+        if brcache.enabled():
+            brcache.save(key, output_dir)
+        brcache.set_key(output_dir, key)
+
+    # Move images into the artifact store and link them into the kernel's output directory
+    images = glob.glob(f"{images_dir}/*Image")
+    if images == [] or not os.path.exists(f"{images_dir}/rootfs.cpio"):
+        return ERR_B_KERNEL_BUILD_FAILED
+    artifacts.store(machine, kernel_ver, {
+        "Image" : images[0],
+        "rootfs.cpio" : f"{images_dir}/rootfs.cpio"
+    })
 
-    os.chdir(script_dir)
     return 0
 
 
@@ -74,12 +132,21 @@ def clean(m):
 
 def kernel_built(machine, kernel_ver):
     """
-    Returns true if a build of the specified kernel is in the output directory.
+    Returns true if a build of the specified kernel is in the output directory and was built from
+    the same configuration we would build it with now.
     """
-    if os.path.exists(f"{out_dir}/{machine.name}/{kernel_ver}") \
-            and os.path.exists(f"{out_dir}/{machine.name}/{kernel_ver}/rootfs.cpio"):
-        return True
-    return False
+    return artifacts.built(machine, kernel_ver)
+
+def write_kernel_config(kernel_ver, file):
+    """
+    Write the kernel specific part of the Buildroot config (appended to the machine's template).
+    """
+    # Change kernel version
+    file.write(f"BR2_LINUX_KERNEL_CUSTOM_VERSION_VALUE=\"{kernel_ver}\"\n")
+    file.write(f"BR2_LINUX_KERNEL_VERSION=\"{kernel_ver}\"\n")
+
+    # Set kernel headers
+    write_kernel_headers(kernel_ver, file)
 
 def write_kernel_headers(kernel_ver, file):
     """
@@ -138,6 +205,12 @@ conf = json.load(open("../conf/build.json"))
 br_dir = conf["buildroot-dir"]
 out_dir = conf["output-dir"]
 br_conf_dir = conf["br-conf-dir"]
+farm_dir = conf.get("farm-dir", f"{br_dir}/farm")
+build_jobs = conf.get("build-jobs", os.cpu_count())
+cache_dir = conf.get("cache-dir", None)
+store_dir = conf.get("artifact-dir", f"{out_dir}/.store")
+ccache_dir = conf.get("ccache-dir", None)
+ccache_size = conf.get("ccache-size", "20G")
 
 if not os.path.exists(out_dir):
     os.mkdir(f"{out_dir}/")
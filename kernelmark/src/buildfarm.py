@@ -0,0 +1,75 @@
+# buildfarm
+#   Runs several Buildroot builds at once for kernelmark. Each build slot gets its own
+#   Buildroot output directory (O=) and a share of the configured job budget.
+# 10/2026
+
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+
+import build
+from error import *
+
+
+def build_all(machine, kernels, num_builds, total_jobs=None):
+    """
+    Build every kernel in kernels (same format as the kernels json) for machine, num_builds at a time.
+    Returns a dict of kernel version -> error code.
+    """
+    if total_jobs is None:
+        total_jobs = build.build_jobs
+    jobs = max(1, total_jobs // num_builds)
+
+    versions = []
+    for major in kernels:
+        for kernel in kernels[major]:
+            versions.append(kernel)
+
+    # Slots are reused between builds so each output dir only builds its toolchain once
+    slots = Queue()
+    for i in range(num_builds):
+        slots.put(slot_dir(machine, i))
+
+    print(f"Build farm: {len(versions)} kernels, {num_builds} builds at a time, {jobs} jobs each.")
+    with ThreadPoolExecutor(max_workers=num_builds) as pool:
+        statuses = pool.map(lambda k: build_in_slot(machine, k, slots, jobs), versions)
+        return dict(zip(versions, statuses))
+
+
+def build_in_slot(machine, kernel_ver, slots, jobs):
+    """
+    Take a free slot, build kernel_ver in it and give the slot back. Retries once with make clean
+    like the serial path in kernelmark.
+    """
+    slot = slots.get()
+    try:
+        print(f"Build farm: building {kernel_ver} in {slot}")
+        status = build.build(machine, kernel_ver, False, slot, jobs)
+        if status != ERR_OK:
+            print(f"Build farm: {kernel_ver} failed. Retrying with make clean.")
+            status = build.build(machine, kernel_ver, True, slot, jobs)
+        if status != ERR_OK:
+            print(f"Build farm: {kernel_ver} failed to build.")
+        return status
+    finally:
+        slots.put(slot)
+
+
+def slot_dir(machine, slot):
+    """
+    Buildroot output directory for a build slot.
+    """
+    return f"{build.farm_dir}/{machine.name}/{slot}"
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    from machine import Machine
+    if len(sys.argv) < 4:
+        print("USAGE: buildfarm.py [machine] [kernels.json] [num builds] [total jobs]")
+        exit(0)
+    mf = json.load(open("../conf/machines.json"))
+    m = Machine(sys.argv[1], mf[sys.argv[1]])
+    jobs = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    for kernel, status in build_all(m, json.load(open(sys.argv[2])), int(sys.argv[3]), jobs).items():
+        print(f"{kernel}: {'OK' if status == ERR_OK else 'FAILED'}")
@@ -0,0 +1,159 @@
+# campaign
+#   Tests several machines at once. Builds are scheduled per ISA (one build queue per ISA, each
+#   machine building in its own Buildroot output dir so they don't fight over one tree), and each
+#   target deploys and tests its kernels as soon as they're built, concurrently with the other
+#   targets. Load generators are shared between targets through the generators pool. Testers
+#   run in processes of their own (they fork, and builders are threads), and wait for their
+#   targets to boot through one listener in this process (see readiness.BootRelay).
+# 10/2026
+
+import sys
+import json
+import multiprocessing
+import threading
+from signal import signal, SIGINT
+
+import build
+import buildfarm
+import pipeline
+import readiness
+from machine import Machine
+from error import *
+from kernelmark import DEFAULT_TESTFLAGS, MAX_FAILS, alert, interrupt_handler
+
+
+def usage():
+    print("USAGE: campaign.py [campaign.json] [flags]")
+    print(" campaign.json maps machine names (from conf/machines.json) to kernels json files:")
+    print("   { \"haswell3\" : \"../kernels_major.json\", \"imx8mm\" : \"../kernels_just_6.json\" }")
+    print(" FLAGS: buildonly, skipdone, local, localtransport, json-stream, runbench, adaptive, early-stop[=PCT] and any kernelmark test flags")
+    exit()
+
+
+def main():
+    signal(SIGINT, interrupt_handler)
+    if len(sys.argv) < 2:
+        usage()
+
+    mf = json.load(open("../conf/machines.json"))
+    plan = json.load(open(sys.argv[1]))
+
+    # Collect flags. Anything that isn't a campaign flag is passed through to the tester.
+    flags = sys.argv[2:]
+    buildonly = "buildonly" in flags
+    skipdone = "skipdone" in flags
+    local = "local" in flags
+    extra = [f for f in flags if f in ["localtransport", "json-stream", "runbench", "adaptive"]
+             or f.split("=")[0] == "early-stop"]
+    testflags = [f for f in flags if f not in ["buildonly", "skipdone", "local"] + extra]
+    if testflags == []:
+        testflags = DEFAULT_TESTFLAGS.copy()
+    if "bidir" not in testflags:
+        testflags.append("unidir")
+    testflags += extra
+
+    # Group machines by ISA
+    isas = {}
+    targets = []
+    for name in plan:
+        if name not in mf:
+            print(f"Machine {name} not found in manifest.")
+            exit()
+        m = Machine(name, mf[name])
+        targets.append((m, json.load(open(plan[name]))))
+        isas.setdefault(m.isa, []).append(targets[-1])
+
+    alert(f"Campaign started. targets: {', '.join(plan)} ISAs: {', '.join(isas)}")
+    jobs = max(1, build.build_jobs // len(isas))
+
+    ctx = multiprocessing.get_context("spawn")
+    queues = {}
+    stops = {}
+    threads = []
+    testers = []
+    for m, _ in targets:
+        queues[m.name] = ctx.Queue(maxsize=pipeline.DEFAULT_DEPTH)
+        stops[m.name] = ctx.Event()
+
+    # Testers can't each listen for their target's boot themselves
+    relay = None
+    if not buildonly:
+        relay = readiness.BootRelay()
+        relay.start()
+
+    # One builder per ISA
+    for isa in isas:
+        t = threading.Thread(target=build_isa, args=(isas[isa], queues, stops, jobs, buildonly))
+        t.start()
+        threads.append(t)
+
+    # One tester per target
+    if not buildonly:
+        for m, _ in targets:
+            p = ctx.Process(target=test_target,
+                            args=(m, queues[m.name], stops[m.name], local, testflags, skipdone))
+            p.start()
+            testers.append(p)
+
+    for t in threads:
+        t.join()
+    for p in testers:
+        p.join()
+    if relay is not None:
+        relay.close()
+    alert("Campaign complete!")
+
+
+def build_isa(targets, queues, stops, jobs, buildonly):
+    """
+    Build every kernel for machines sharing an ISA, taking the machines in turn so all targets
+    get work early. Each built kernel is handed to its machine's tester.
+    """
+    pending = []
+    for m, kernels in targets:
+        pending.append((m, [k for major in kernels for k in kernels[major]]))
+
+    fails = {m.name: 0 for m, _ in targets}
+    while pending != []:
+        for m, kernels in pending.copy():
+            if kernels == [] or stops[m.name].is_set() or fails[m.name] >= MAX_FAILS:
+                if fails[m.name] >= MAX_FAILS:
+                    alert(f"Too many consecutive build failures on {m.name}!")
+                pending.remove((m, kernels))
+                if not buildonly:
+                    pipeline.put(queues[m.name], None, stops[m.name])
+                continue
+
+            kernel = kernels.pop(0)
+            if build_kernel(m, kernel, jobs) != ERR_OK:
+                fails[m.name] += 1
+                continue
+            fails[m.name] = 0
+            if not buildonly:
+                pipeline.put(queues[m.name], kernel, stops[m.name])
+
+
+def build_kernel(m, kernel, jobs):
+    """
+    Build in the machine's own output dir, retrying once with make clean.
+    """
+    alert(f"\033[01m ### BUILDING: {m.name} kernel {kernel} ###\033[00m")
+    status = build.build(m, kernel, False, buildfarm.slot_dir(m, 0), jobs)
+    if status != ERR_OK:
+        alert(f"{m.name} kernel {kernel} failed to build. Retrying with make clean.")
+        status = build.build(m, kernel, True, buildfarm.slot_dir(m, 0), jobs)
+    if status != ERR_OK:
+        alert(f"{m.name} kernel {kernel} failed to build. Continuing")
+    return status
+
+
+def test_target(m, ready, stop, local, testflags, skipdone):
+    try:
+        pipeline.consume(m, ready, local, testflags, skipdone, alert)
+    finally:
+        # Stop building for this target if its tester gave up
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# ccache
+#   Compiler cache support for kernelmark builds. Neighbouring kernel versions share most of their
+#   translation units, so builds share one ccache directory (size capped, ccache evicts the least
+#   recently used entries itself). Hit/miss stats for each build are written next to build.log.
+# 10/2026
+
+import os
+import subprocess
+
+import build
+
+HIT_COUNTERS = ["direct_cache_hit", "preprocessed_cache_hit"]
+MISS_COUNTERS = ["cache_miss"]
+
+
+def enabled():
+    return build.ccache_dir is not None
+
+
+def write_config(file):
+    """
+    Write Buildroot options to build with ccache.
+    """
+    if not enabled():
+        return
+    file.write("BR2_CCACHE=y\n")
+    file.write(f"BR2_CCACHE_DIR=\"{build.ccache_dir}\"\n")
+    file.write(f"BR2_CCACHE_INITIAL_SETUP=\"--max-size={build.ccache_size}\"\n")
+    file.write("BR2_CCACHE_USE_BASEDIR=y\n")
+
+
+def binary(output_dir):
+    """
+    Buildroot's host ccache if it has been built, otherwise whatever is on the path.
+    """
+    if os.path.exists(f"{output_dir}/host/bin/ccache"):
+        return f"{output_dir}/host/bin/ccache"
+    return "ccache"
+
+
+def run(output_dir, args):
+    env = dict(os.environ, CCACHE_DIR=build.ccache_dir)
+    try:
+        return subprocess.run([binary(output_dir)] + args, env=env, capture_output=True,
+                              text=True).stdout
+    except OSError:
+        return None
+
+
+def prepare(output_dir, statslog):
+    """
+    Apply the size cap and take a snapshot of the cache counters before a build.
+    Returns the environment prefix for make so each compile gets logged to statslog.
+    """
+    os.makedirs(build.ccache_dir, exist_ok=True)
+    run(output_dir, ["--max-size", build.ccache_size])
+    if os.path.exists(statslog):
+        os.remove(statslog)
+    return f"CCACHE_STATSLOG={statslog} "
+
+
+def stats(output_dir):
+    """
+    Counters for the whole cache directory, or None if ccache isn't available yet.
+    """
+    out = run(output_dir, ["--print-stats"])
+    if out is None:
+        return None
+    counters = {}
+    for line in out.splitlines():
+        fields = line.split("\t")
+        if len(fields) == 2 and fields[1].isdigit():
+            counters[fields[0]] = int(fields[1])
+    return counters
+
+
+def statslog_counters(statslog):
+    """
+    Count results from a ccache stats log (one counter name per line, # lines name the source file).
+    """
+    counters = {}
+    with open(statslog) as f:
+        for line in f:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            counters[line] = counters.get(line, 0) + 1
+    return counters
+
+
+def report(output_dir, statslog, before, path):
+    """
+    Write hit/miss stats for a build to path. Uses the per-build stats log if ccache supports it,
+    otherwise the difference in the shared counters (which includes any concurrent builds).
+    """
+    if os.path.exists(statslog):
+        counters = statslog_counters(statslog)
+        source = "per-build stats log"
+    else:
+        after = stats(output_dir)
+        if after is None:
+            return
+        if before is None:
+            before = {}
+        counters = {}
+        for name in after:
+            counters[name] = after[name] - before.get(name, 0)
+        source = "difference of shared cache counters"
+
+    hits = sum(counters.get(c, 0) for c in HIT_COUNTERS)
+    misses = sum(counters.get(c, 0) for c in MISS_COUNTERS)
+    rate = 0.0
+    if hits + misses > 0:
+        rate = 100.0 * hits / (hits + misses)
+
+    with open(path, "w") as f:
+        f.write(f"source: {source}\n")
+        f.write(f"hits: {hits}\n")
+        f.write(f"misses: {misses}\n")
+        f.write(f"hit_rate: {rate:.1f}%\n")
+        for name in sorted(counters):
+            if counters[name] != 0 and name not in HIT_COUNTERS + MISS_COUNTERS:
+                f.write(f"{name}: {counters[name]}\n")
+    print(f"ccache: {hits} hits, {misses} misses ({rate:.1f}%)")
@@ -0,0 +1,141 @@
+# collector
+#   Streams iperf3 results back over the control channel. iperf3 writes its JSON to stdout on the
+#   load generator and it is collected here as it arrives, rather than written to a logfile and
+#   copied back afterwards. With --json-stream (iperf3 3.17+) interval records arrive during the
+#   run, so progress can be shown live, and a test can be stopped once it has settled (see
+#   earlystop). Results are written to the results dir atomically.
+# 10/2026
+
+import asyncio
+import json
+import os
+
+import earlystop
+
+START = "start"
+INTERVAL = "interval"
+END = "end"
+ERROR = "error"
+
+
+class ResultCollector():
+    def __init__(self, dest, json_stream, label, monitor=None, source=0):
+        """
+        Collect the iperf3 output for one client into dest. json_stream must match whether
+        iperf3 was run with --json-stream. If given a Monitor (see earlystop), iperf3 is run in
+        segments until the monitor is done, and intervals are fed to it as this client's source.
+        """
+        self.dest = dest
+        self.json_stream = json_stream
+        self.label = label
+        self.monitor = monitor
+        self.source = source
+        self.raw = []
+        self.doc = {START: {}, "intervals": [], END: {}}
+        self.segments = []
+        self.elapsed = 0.0  # length of the segments before this one
+
+    def feed(self, line):
+        """
+        Take one line of iperf3 output.
+        """
+        if not self.json_stream:
+            self.raw.append(line)
+            return
+
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return
+        event = record.get("event")
+        data = record.get("data")
+        if event == START or event == END:
+            self.doc[event] = data
+        elif event == INTERVAL:
+            if self.monitor is not None:
+                earlystop.shift(data, self.elapsed)
+                self.monitor.add(self.source, data)
+            self.doc["intervals"].append(data)
+            self.progress(data)
+        elif event == ERROR:
+            self.doc[ERROR] = data
+            print(f"{self.label}: iperf3 error: {data}")
+
+    def progress(self, interval):
+        try:
+            t = interval["sum"]["end"]
+            mbits = interval["sum"]["bits_per_second"] / (10**6)
+        except (KeyError, TypeError):
+            return
+        line = f"{self.label}: {t:5.1f}s {mbits:8.1f} Mbit/s"
+        if "sum_bidir_reverse" in interval:
+            line += f" (reverse {interval['sum_bidir_reverse']['bits_per_second'] / (10**6):.1f} Mbit/s)"
+        print(line)
+
+    def next_segment(self):
+        """
+        Close off a run which was a segment of a test that can stop early. Returns True if another
+        segment should be run.
+        """
+        if self.monitor is None or self.doc[END] == {}:
+            return False
+        self.segments.append(self.doc)
+        if self.doc["intervals"] != []:
+            self.elapsed = self.doc["intervals"][-1]["sum"]["end"]
+        self.doc = {START: {}, "intervals": [], END: {}}
+        return self.monitor.more()
+
+    def finish(self):
+        """
+        Write the collected result. Returns False if nothing usable arrived.
+        """
+        if self.json_stream:
+            doc = self.doc
+            if self.segments != []:
+                if self.doc["intervals"] != []:
+                    print(f"WARNING: {self.label}: last segment didn't finish - leaving it out")
+                doc = earlystop.merge(self.segments)
+            if doc[END] == {} and doc["intervals"] == []:
+                return False
+            if self.monitor is not None:
+                doc["kernelmark"] = self.monitor.report()
+                doc["kernelmark"]["segments"] = len(self.segments)
+            data = json.dumps(doc, indent=4).encode()
+        else:
+            data = b"".join(self.raw)
+            if data.strip() == b"":
+                return False
+        write_atomic(self.dest, data)
+        return True
+
+
+def write_atomic(path, data):
+    """
+    Write data to path so that readers only ever see the complete file.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+async def run(transport, host, cmd, collector, between=None):
+    """
+    Run cmd on host, feeding its output to collector. If the collector has a Monitor, cmd is one
+    segment of the test and is run again until the monitor is done, awaiting between() (if given)
+    before each further segment. Returns the exit code.
+    """
+    while True:
+        proc = await transport.start_async(host, cmd, stdout=asyncio.subprocess.PIPE)
+        async for line in proc.stdout:
+            collector.feed(line)
+        code = await proc.wait()
+        if code != 0 or not collector.next_segment():
+            break
+        if between is not None:
+            await between()
+    if not collector.finish():
+        print(f"WARNING: no results from {host} for {collector.label}")
+    return code
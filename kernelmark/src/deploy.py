@@ -5,6 +5,7 @@
 # 12/2022
 
 import os
+import artifacts
 from build import out_dir
 from error import *
 # from machine import Machine
@@ -14,9 +15,11 @@ def deploy(machine, kernel_ver):
     os.system(f"mq.sh sem -signal {machine.name}")
 
     # os.execl("/home/mattr/bin/mq.sh", "/home/mattr/bin/mq.sh", "run", "-c", "Ostritch", "-s", f"{machine.name}", "-L", "-d", "1200", "-f", f"{out_dir}/{machine.name}/{kernel_ver}/Image", "-f", f"{out_dir}/{machine.name}/{kernel_ver}/rootfs.cpio")
-    result = os.system(f"mq.sh run -c \"Ostritch\" -s {machine.name} -L \
-        -d 1200 -f {out_dir}/{machine.name}/{kernel_ver}/*Image \
-            -f {out_dir}/{machine.name}/{kernel_ver}/rootfs.cpio")
+    # the rootfs is only written out from the artifact store while it's needed
+    with artifacts.checkout(machine, kernel_ver):
+        result = os.system(f"mq.sh run -c \"Ostritch\" -s {machine.name} -L \
+            -d 1200 -f {out_dir}/{machine.name}/{kernel_ver}/*Image \
+                -f {out_dir}/{machine.name}/{kernel_ver}/rootfs.cpio")
     return result 
     
 
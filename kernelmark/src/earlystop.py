@@ -0,0 +1,193 @@
+# earlystop
+#   Stop iperf3 tests once their throughput has settled. A test is run as a series of short runs
+#   (segments), each of which finishes normally, so iperf3 still exchanges results with the server
+#   and every figure - including the server side ones - is there. Interval results streamed back
+#   (see collector) are fed to a Monitor, which works out a confidence interval for the mean
+#   throughput and calls the test done once it is narrow enough, and no more segments are run.
+#   The segments are then merged into one result as if it had been one long run. How precise the
+#   result ended up is recorded in it, so shortened tests can be told apart later (see resultdb).
+# 10/2026
+
+import math
+import statistics
+
+TARGET = 0.02       # default precision: CI half width as a fraction of the mean
+CONFIDENCE = 0.95
+MIN_DURATION = 10   # seconds a test goes on for at least
+SEGMENT = 10        # seconds per run (iperf3 -t) of a test which can stop early
+SKIP = 2            # leading intervals left out of the estimate (TCP slow start etc.)
+
+# Fields of iperf3 end results which add up over segments. Rates and percentages are worked out
+# again from them, start and end times are kept, and everything else is averaged.
+SUMMED = ["seconds", "bytes", "packets", "lost_packets", "out_of_order", "retransmits"]
+KEPT = ["start", "end", "socket"]
+
+
+def t_quantile(confidence, df):
+    """
+    Two sided Student's t critical value, by Cornish-Fisher expansion of the normal quantile.
+    """
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    return (z + (z**3 + z) / (4 * df)
+            + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+            + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3))
+
+
+class Monitor():
+    def __init__(self, sources=1, target=TARGET, max_duration=None, min_duration=MIN_DURATION,
+                 confidence=CONFIDENCE):
+        """
+        Watch the throughput of sources iperf3 clients run together, e.g. the threads of a
+        multicore test, which are stopped together once their total throughput has settled, or
+        after max_duration seconds.
+        """
+        self.series = [[] for _ in range(sources)]
+        self.ends = [0.0] * sources
+        self.target = target
+        self.max_duration = max_duration
+        self.min_duration = min_duration
+        self.confidence = confidence
+        self.done = False
+
+    def add(self, source, interval):
+        """
+        Take an interval record from one of the sources. Returns True once the test can stop.
+        """
+        try:
+            end = interval["sum"]["end"]
+            bps = interval["sum"]["bits_per_second"]
+            omitted = interval["sum"].get("omitted", False)
+        except (KeyError, TypeError, AttributeError):
+            return self.done
+        self.ends[source] = end
+        if not omitted:
+            self.series[source].append(bps)
+
+        if not self.done and self.settled():
+            self.done = True
+            mean, half = self.estimate()
+            print(f"Throughput {mean / (10**6):.1f} ± {half / (10**6):.1f} Mbit/s after "
+                  f"{self.duration():.0f}s - stopping after this segment")
+        return self.done
+
+    def duration(self):
+        return min(self.ends)
+
+    def more(self):
+        """
+        True if the test should go on for another segment. Interval times must run on from one
+        segment to the next (see shift).
+        """
+        if self.done:
+            return False
+        return self.max_duration is None or self.duration() < self.max_duration - SEGMENT / 2
+
+    def samples(self):
+        """
+        Total throughput of the sources for each interval they have all reported.
+        """
+        n = min(len(s) for s in self.series)
+        return [sum(s[i] for s in self.series) for i in range(SKIP, n)]
+
+    def estimate(self):
+        """
+        (mean, confidence interval half width) of the throughput, or None with too few intervals.
+        Intervals are treated as independent, so this is a little optimistic.
+        """
+        x = self.samples()
+        if len(x) < 3:
+            return None
+        half = t_quantile(self.confidence, len(x) - 1) * statistics.stdev(x) / math.sqrt(len(x))
+        return statistics.fmean(x), half
+
+    def settled(self):
+        if self.duration() < self.min_duration:
+            return False
+        e = self.estimate()
+        return e is not None and e[0] > 0 and e[1] <= self.target * e[0]
+
+    def report(self):
+        """
+        What's recorded with the result: precision is the achieved CI half width as a fraction
+        of the mean (None if it couldn't be estimated).
+        """
+        out = {
+            "target" : self.target,
+            "confidence" : self.confidence,
+            "stopped_early" : self.done,
+            "duration" : self.duration(),
+            "intervals" : len(self.samples()),
+            "mean" : None,
+            "precision" : None
+        }
+        e = self.estimate()
+        if e is not None:
+            out["mean"] = e[0]
+            if e[0] > 0:
+                out["precision"] = e[1] / e[0]
+        return out
+
+
+def shift(interval, offset):
+    """
+    Move an interval record of a segment offset seconds on, to where it falls in the whole test.
+    """
+    for value in interval.values():
+        for obj in (value if isinstance(value, list) else [value]):
+            if isinstance(obj, dict):
+                for key in ["start", "end"]:
+                    if isinstance(obj.get(key), (int, float)):
+                        obj[key] += offset
+    return interval
+
+
+def merge(docs):
+    """
+    Merge the results of a test's segments (with intervals already shifted) into one, as if the
+    test had been one long run.
+    """
+    out = dict(docs[0])
+    out["intervals"] = [i for d in docs for i in d["intervals"]]
+    ends = [d["end"] for d in docs]
+    weights = [e.get("sum_sent", e.get("sum", {})).get("seconds", 1) for e in ends]
+    out["end"] = combine(ends, weights)
+    return out
+
+
+def combine(objs, weights):
+    """
+    Combine the same object (e.g. end.sum_sent) from each segment's end results, weights being
+    the segments' lengths.
+    """
+    out = {}
+    for key, value in objs[0].items():
+        present = [(o[key], w) for o, w in zip(objs, weights) if key in o]
+        values = [v for v, _ in present]
+        if isinstance(value, dict):
+            out[key] = combine(values, [w for _, w in present])
+        elif isinstance(value, list):
+            # streams, combined stream by stream
+            if all(isinstance(v, list) and len(v) == len(value) for v in values) \
+                    and all(isinstance(x, dict) for x in value):
+                out[key] = [combine([v[i] for v in values], [w for _, w in present]) for i in range(len(value))]
+            else:
+                out[key] = value
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or key in KEPT:
+            out[key] = value
+        elif key in SUMMED:
+            out[key] = sum(values)
+        elif key.startswith("min_"):
+            out[key] = min(values)
+        elif key.startswith("max_"):
+            out[key] = max(values)
+        else:
+            total = sum(w for _, w in present)
+            out[key] = sum(v * w for v, w in present) / total if total > 0 else value
+
+    if isinstance(out.get("start"), (int, float)) and isinstance(out.get("end"), (int, float)):
+        out["end"] = out["start"] + sum(o["end"] - o["start"] for o in objs if "start" in o and "end" in o)
+    if "bits_per_second" in out and "bytes" in out and out.get("seconds"):
+        out["bits_per_second"] = out["bytes"] * 8 / out["seconds"]
+    if "lost_percent" in out and "lost_packets" in out and out.get("packets"):
+        out["lost_percent"] = 100 * out["lost_packets"] / out["packets"]
+    return out
@@ -4,15 +4,23 @@
 # Matt Rossouw (omeh-a)
 # 01/23
 
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
-import json
+from matplotlib.figure import Figure
+from concurrent.futures import ProcessPoolExecutor
 import os
 from statistics import mean
-from test import MAX_PKT_SZ
+from test import MAX_PKT_SZ, bws as FIXED_BWS
 import csv
+import resultdb
+import resulttable
+import ipbenchdata
+import numpy as np
 
 IDEAL_LATENCY = 0.005
 THROUGHPUT_BENCH_BW = 1000
+RENDER_WORKERS = None  # processes drawing plots, default one per core
 IPBENCH_PKTSIZES = [
     1448, 1217, 1120, 1056, 1024, 1000, 861, 800, 724, 680, 608, 590,
     580, 512, 430, 362, 304, 256, 215, 181, 152, 128, 90, 76, 64
@@ -23,12 +31,16 @@ IPBENCH_OUTPUT_COLUMNS = [
 ]
 
 
-def finalise_ipbench(out_dir, machine_name, sender):
+def finalise_ipbench(out_dir, machine_name, sender, changes=None):
     """
     Retrieve unmarshalled results from machine by kernel version and generate graphs.
+    If given the changes from an ingest (see resultdb), only regenerate if an ipbench result changed.
     """
+    if changes is not None and not any(c["kind"] == "ipbench" for c in changes):
+        print(f"No new ipbench results for {machine_name}")
+        return
 
-    plt.clf()
+    fig, ax = new_plot()
     y_range = []
     x_range = []
     key = "received"
@@ -41,88 +53,117 @@ def finalise_ipbench(out_dir, machine_name, sender):
             print(f"No ipbench results for kernel {kernel}!")
             continue
 
-        csv = ipbench_csv(f"{out_dir}/{machine_name}/{kernel}/ipbench_result")
-        requested = []
-        achieved = []
-
-        # Plot requested vs. achieved throughput
-        for i in range(0, len(csv["Requested-throughput"])):
-            requested.append(csv["Requested-throughput"][i])
-            achieved.append(csv[f"Achieved-throughput-{key}"][i])
-
-            # Ranging info
-            if csv[f"Achieved-throughput-{key}"][i] not in y_range:
-                y_range.append(csv[f"Achieved-throughput-{key}"][i])
-            if csv["Requested-throughput"][i] not in x_range:
-                x_range.append(csv["Requested-throughput"][i])
-                x_range.append(csv["Achieved-throughput-sent"][i])
-            # convert to megabits
-        for i in range(len(requested)):
-            requested[i] = int(requested[i]) / (10**6)
-            achieved[i] = int(achieved[i]) / (10**6)
-        print(f"Requested: {requested} \n Achieved: {achieved}")
-        plt.plot(requested, achieved, label=f"{kernel} - {key}")
+        result = ipbenchdata.load(f"{out_dir}/{machine_name}/{kernel}/ipbench_result")
+        if len(result["Requested-throughput"]) == 0 or f"Achieved-throughput-{key}" not in result:
+            print(f"No usable ipbench results for kernel {kernel}!")
+            continue
+
+        # Plot requested vs. achieved throughput, in megabits. Adaptive sweeps (see saturation)
+        # don't run in rate order.
+        order = np.argsort(result["Requested-throughput"], kind="stable")
+        requested = result["Requested-throughput"][order] / (10**6)
+        achieved = result[f"Achieved-throughput-{key}"][order] / (10**6)
+        print(f"Requested: {requested.tolist()} \n Achieved: {achieved.tolist()}")
+        ax.plot(requested, achieved, label=f"{kernel} - {key}")
+
+        # Ranging info
+        y_range.append(achieved)
+        x_range.append(requested)
+        if "Achieved-throughput-sent" in result:
+            x_range.append(result["Achieved-throughput-sent"] / (10**6))
 
-    
     if x_range == [] or y_range == []:
         print("No results! Exiting")
         exit(0)
-    
-    # convert axes to megabits
-    for i in range(len(x_range)):
-        x_range[i] = int(x_range[i]) / 10**6
-    for i in range(len(y_range)):
-        y_range[i] = int(y_range[i]) / 10**6
-    
-    
-    plt.xlabel("Requested throughput (MBit/s)")
-    plt.ylabel("Achieved throughput (MBit/s)")
-    plt.title(f"{machine_name} {kernel} - ipbench Requested vs Achieved throughput ({key})")
-    plt.yticks(ticks(y_range, 10))
-    plt.xticks(ticks(x_range, 10))
-    ax = plt.gca()
+    x_range = np.concatenate(x_range)
+    y_range = np.concatenate(y_range)
+
+    ax.set_xlabel("Requested throughput (MBit/s)")
+    ax.set_ylabel("Achieved throughput (MBit/s)")
+    ax.set_title(f"{machine_name} {kernel} - ipbench Requested vs Achieved throughput ({key})")
+    ax.set_yticks(ticks(y_range, 10))
+    ax.set_xticks(ticks(x_range, 10))
     ax.legend()
     ax.yaxis.set_major_formatter('{x:9<5.1f}')
-    plt.savefig(f"../results/{machine_name}-{key}-ipbench.png")
+    save_plot(fig, f"../results/{machine_name}-{key}-ipbench.png")
 
-def ipbench_csv(path):
+def finalise_iperf3(out_dir, machine_name, changes=None):
     """
-    Python's csv library is awful apparently so I need to do this myself.
-    Given a csv file with the first row containing headers, return a dict
-    """
-    out = {}
-    with open(path, "r") as f:
-        first = True
-        headers = []
-        for row in f:
-            # get headers from first row
-            if first:
-                first = False
-                for term in row.split(','):
-                    headers.append(term)
-                    out[term] = []
-            # get rest
-            else:
-                i = 0
-                for term in row.split(','):
-                    out[headers[i]].append(term)
-                    i += 1
-    return out
-    # now how hard was that? why can the python csv library not find the headers properly??
-
-def finalise_iperf3(out_dir, machine_name):
-    """
-    Generate iperf3 results for all available result files
+    Generate iperf3 results for all available result files.
+    If given the changes from an ingest (see resultdb), only the plots that new or changed
+    results appear in are regenerated.
     """               
-    r = iperf_results(out_dir, machine_name)
+    r = iperf_results(out_dir, machine_name, changes)
+    if r.changes == []:
+        print(f"No new iperf3 results for {machine_name}")
+        return
     # everything in the name of compactness
+    jobs = []
     for cond in [(False, False), (False, True), (True, True)]:
-        iperf3_st_pktsz_throughput(r, cond[0], cond[1])
-        iperf3_st_bw_throughput(r, cond[0], cond[1])
-        # iperf3_mt_bw_throughput(r, cond[0], cond[1])
+        jobs.append((iperf3_st_pktsz_throughput, cond))
+        jobs.append((iperf3_st_bw_throughput, cond))
+        # jobs.append((iperf3_mt_bw_throughput, cond))
         if cond[1]:
-            iperf3_st_bw_cpu(r, cond[0])
-            iperf3_st_bw_latency(r, cond[0])
+            jobs.append((iperf3_st_bw_cpu, (cond[0],)))
+            jobs.append((iperf3_st_bw_latency, (cond[0],)))
+    render_all(r, jobs)
+
+
+def precision_bars(ax, line, xs, test, throughput_type):
+    """
+    Error bars on a throughput line showing how precise each run got, for runs which could
+    stop early (see earlystop). Full length runs get none, so plots without any are unchanged.
+    Precision is of the forward throughput only.
+    """
+    precision = np.asarray(test["precision"], dtype=np.float64)
+    if throughput_type != "throughput_send" or not np.isfinite(precision).any():
+        return
+    ys = np.asarray(test[throughput_type])
+    ax.errorbar(xs, ys, yerr=np.nan_to_num(precision) * ys, fmt="none", ecolor=line.get_color(), capsize=2)
+
+
+def new_plot():
+    """
+    Fresh figure and axes for a plot. Figures are made directly rather than through pyplot so
+    plots don't share state and can be drawn in parallel.
+    """
+    fig = Figure()
+    return fig, fig.add_subplot()
+
+
+def save_plot(fig, path):
+    fig.savefig(path)
+
+
+def render_init(results):
+    global render_results
+    render_results = results
+
+
+def render(job):
+    fn, args = job
+    fn(render_results, *args)
+
+
+def render_all(results, jobs, workers=RENDER_WORKERS):
+    """
+    Draw plots in parallel. jobs is a list of (plot function, arguments after results). Each
+    worker process gets its own copy of results.
+    """
+    if workers == None:
+        workers = os.cpu_count()
+    if workers <= 1:
+        for fn, args in jobs:
+            fn(results, *args)
+        return
+
+    with ProcessPoolExecutor(min(workers, len(jobs)), initializer=render_init, initargs=(results,)) as pool:
+        futures = [pool.submit(render, job) for job in jobs]
+        for (fn, args), future in zip(jobs, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to draw {fn.__name__}{args}: {e}")
 
 
 def iperf3_st_pktsz_throughput(results, reverse, bidir):
@@ -134,16 +175,18 @@ def iperf3_st_pktsz_throughput(results, reverse, bidir):
         throughput_type = "throughput_receive"
 
     for tcp in [True, False]:
+        if not results.redraw(tcp, bidir):
+            continue
         if len(results.tcp_st_tests) != 0:
             print(f"{results.machinename} - ST Throughtput - TCP targeting 1000Mb/s")
-            plt.clf()
+            fig, ax = new_plot()
             y_largest_range = []
             for kernel in results.kernels:
                 test = None
                 if tcp:
-                    test = results.get_st_test_pktsize_tcp(kernel)
+                    test = results.get_st_test_pktsize_tcp(kernel, bidir)
                 else:
-                    test = results.get_st_test_pktsize_udp(kernel)
+                    test = results.get_st_test_pktsize_udp(kernel, bidir)
                 if test == None:
                     continue
                 
@@ -151,22 +194,25 @@ def iperf3_st_pktsz_throughput(results, reverse, bidir):
                     y_largest_range.append(element)
 
 
-                plt.plot(test["pkt_szs"], test[throughput_type], label=f"{kernel}")
-            plt.xlabel("Packet sizes (bytes)")
-            plt.ylabel("Throughput (MBit/s)")
+                line, = ax.plot(test["pkt_szs"], test[throughput_type], label=f"{kernel}")
+                precision_bars(ax, line, test["pkt_szs"], test, throughput_type)
+            if y_largest_range == []:
+                continue
+            ax.set_xlabel("Packet sizes (bytes)")
+            ax.set_ylabel("Throughput (MBit/s)")
             label = "UDP"
             if tcp:
                 label = "TCP"
             
-            plt.title(f"{results.machinename} - ST Throughtput - {label} targeting 1000Mb/s")
-            plt.yticks(ticks(y_largest_range, 10))
-            ax = plt.gca()
+            ax.set_title(f"{results.machinename} - ST Throughtput - {label} targeting 1000Mb/s")
+            ax.set_yticks(ticks(y_largest_range, 10))
             ax.yaxis.set_major_formatter('{x:9<5.1f}')
             ax.legend()
 
-            if bidir: throughput_type += "-bidir"
-            s = f"../results/{results.machinename}-st-pktsz-1000m-{label}-{throughput_type}.png"
-            plt.savefig(s)  
+            suffix = throughput_type
+            if bidir: suffix += "-bidir"
+            s = f"../results/{results.machinename}-st-pktsz-1000m-{label}-{suffix}.png"
+            save_plot(fig, s)  
             print(f"Saved {s}")
 
 
@@ -174,15 +220,12 @@ def iperf3_st_pktsize_latency(results):
     """
     Generates plots of latency against packet size for TCP results
     """
-    plt.clf()
+    fig, ax = new_plot()
     y_largest_range = []
     for kernel in results.kernels:
-        test = results.get_st_test_pktsize_tcp(kernel)
+        test = results.get_st_test_pktsize_tcp(kernel, False)
         if test == None:
             continue
-        
-        if test.bidir:
-            continue
 
         print(test)
         # print(test[0])
@@ -191,17 +234,16 @@ def iperf3_st_pktsize_latency(results):
         for element in test["rtt"]:
             y_largest_range.append(element)
 
-        plt.xlabel("Packet sizes (bytes)")
-        plt.ylabel("Latency (us)")
+        ax.set_xlabel("Packet sizes (bytes)")
+        ax.set_ylabel("Latency (us)")
         # plt.ticklabel_format(style='plain', axis='y', useOffset=False)
-        plt.plot(test["pkt_szs"], test["rtt"], label=f"{kernel}")
-    plt.title(f"{results.machinename} - ST Latency - TCP targeting 1000Mb/s")
-    plt.yticks(ticks(y_largest_range, 10))
-    ax = plt.gca()
+        ax.plot(test["pkt_szs"], test["rtt"], label=f"{kernel}")
+    ax.set_title(f"{results.machinename} - ST Latency - TCP targeting 1000Mb/s")
+    ax.set_yticks(ticks(y_largest_range, 10))
     ax.yaxis.set_major_formatter('{x:9<5.1f}')
     ax.legend()
     s = f"../results/{results.machinename}-st-1000m-rtt.png"
-    plt.savefig(s)  
+    save_plot(fig, s)  
     print(f"Saved {s}")
                
 
@@ -210,41 +252,34 @@ def iperf3_st_pktsize_cpu(results):
     Generates plots of cpu against packet size for UDP/TCP results
     """
     # TCP
-    plt.clf()
+    fig, ax = new_plot()
     y_largest_range = []
     for kernel in results.kernels:
-        test = results.get_st_test_pktsize_tcp(kernel)
-        if test == None:
-            continue
-        
+        test = results.get_st_test_pktsize_tcp(kernel, False)
         if test == None:
             continue
-        
-        if test.bidir:
-            continue
 
         for element in test["cpu"]:
             y_largest_range.append(element)
 
-        plt.xlabel("Packet sizes (bytes)")
-        plt.ylabel("CPU utilisation (%)")
+        ax.set_xlabel("Packet sizes (bytes)")
+        ax.set_ylabel("CPU utilisation (%)")
         #pkt_ticks(packet_sizes)
         # plt.ticklabel_format(style='plain', axis='y', useOffset=False)
-        plt.plot(test["pkt_szs"], test["cpu"], label=f"{kernel}")
-    plt.title(f"{results.machinename} - ST CPU - TCP targeting 1000Mb/s")
-    plt.yticks(ticks(y_largest_range, 10))
-    ax = plt.gca()
+        ax.plot(test["pkt_szs"], test["cpu"], label=f"{kernel}")
+    ax.set_title(f"{results.machinename} - ST CPU - TCP targeting 1000Mb/s")
+    ax.set_yticks(ticks(y_largest_range, 10))
     ax.yaxis.set_major_formatter('{x:9<5.1f}')
     ax.legend()
     s = f"../results/{results.machinename}-st-1000m-TCP-cpu.png"
-    plt.savefig(s)
+    save_plot(fig, s)
     print(f"Saved {s}")
 
     # UDP
-    plt.clf()
+    fig, ax = new_plot()
     y_largest_range = []
     for kernel in results.kernels:
-        test = results.get_st_test_pktsize_udp(kernel)
+        test = results.get_st_test_pktsize_udp(kernel, False)
         if test == None:
             continue
         
@@ -256,18 +291,17 @@ def iperf3_st_pktsize_cpu(results):
         for element in test["cpu"]:
             y_largest_range.append(element)
 
-        plt.xlabel("Packet sizes (bytes)")
-        plt.ylabel("CPU utilisation (%)")
+        ax.set_xlabel("Packet sizes (bytes)")
+        ax.set_ylabel("CPU utilisation (%)")
         #pkt_ticks(packet_sizes)
         # plt.ticklabel_format(style='plain', axis='y', useOffset=False)
-        plt.plot(test["pkt_szs"], test["cpu"], label=f"{kernel}")
-    plt.title(f"{results.machinename} - ST Throughtput - UDP targeting 1000Mb/s")
-    plt.yticks(ticks(y_largest_range, 10))
-    ax = plt.gca()
+        ax.plot(test["pkt_szs"], test["cpu"], label=f"{kernel}")
+    ax.set_title(f"{results.machinename} - ST Throughtput - UDP targeting 1000Mb/s")
+    ax.set_yticks(ticks(y_largest_range, 10))
     ax.yaxis.set_major_formatter('{x:9<5.1f}')
     ax.legend()
     s = f"../results/{results.machinename}-st-1000m-UDP-CPU.png"
-    plt.savefig(s)  
+    save_plot(fig, s)  
     print(f"Saved {s}")           
 
 def iperf3_mt_pktsize_throughput(results, ):
@@ -276,7 +310,7 @@ def iperf3_mt_pktsize_throughput(results, ):
     """
     for protocol in ["UDP", "TCP"]:
         for bw in ["1000m"]:
-            plt.clf()
+            fig, ax = new_plot()
             y_range = []
             for kernel in results.kernels:
                 # print(f"Graphing {protocol}-{bw}-{kernel}")
@@ -291,20 +325,19 @@ def iperf3_mt_pktsize_throughput(results, ):
                     if t not in y_range:
                         y_range.append(t)
                 
-                plt.xlabel("Packet sizes (bytes)")
+                ax.set_xlabel("Packet sizes (bytes)")
                 # tt = unitise_plot(sub["throughput"], "Throughput")
-                plt.ylabel("Throughput (MBit/s)")
+                ax.set_ylabel("Throughput (MBit/s)")
                 #pkt_ticks(packet_sizes)
                 # plt.ticklabel_format(style='plain', axis='y', useOffset=False)
-                plt.title(f"{results.machinename} - MT Aggregate Throughput performance - {protocol} targeting {bw[:len(bw)-1]}Mb/s")
+                ax.set_title(f"{results.machinename} - MT Aggregate Throughput performance - {protocol} targeting {bw[:len(bw)-1]}Mb/s")
                 # print(sub["packets"])
                 # sub["packets"].sort()
-                plt.plot(sub["packets"], sub["throughput"], label=f"{kernel}")
-            plt.yticks(ticks(y_range, 10))
-            ax = plt.gca()
+                ax.plot(sub["packets"], sub["throughput"], label=f"{kernel}")
+            ax.set_yticks(ticks(y_range, 10))
             ax.yaxis.set_major_formatter('{x:9<5.1f}')
             ax.legend()
-            plt.savefig(f"../results/{results.machinename}-mt-{bw}-{protocol}-throughput.png")
+            save_plot(fig, f"../results/{results.machinename}-mt-{bw}-{protocol}-throughput.png")
 
 def iperf3_mt_pktsize_cpu(results):
     """
@@ -312,7 +345,7 @@ def iperf3_mt_pktsize_cpu(results):
     """
     for protocol in ["UDP", "TCP"]:
         for bw in ["1000m"]:
-            plt.clf()
+            fig, ax = new_plot()
             y_range = []
             for kernel in results.kernels:
                 # print(f"Graphing {protocol}-{bw}-{kernel}")
@@ -328,17 +361,16 @@ def iperf3_mt_pktsize_cpu(results):
                     if cpu not in y_range:
                         y_range.append(cpu)
                 
-                plt.xlabel("Packet sizes (bytes)")
-                plt.ylabel("CPU Utilisation (%)")
+                ax.set_xlabel("Packet sizes (bytes)")
+                ax.set_ylabel("CPU Utilisation (%)")
                 # plt.ticklabel_format(style='plain', axis='y', useOffset=False)
-                plt.title(f"{results.machinename} - MT Mean CPU Utilisation (per core) - {protocol} targeting {bw[:len(bw)-1]}Mb/s")
+                ax.set_title(f"{results.machinename} - MT Mean CPU Utilisation (per core) - {protocol} targeting {bw[:len(bw)-1]}Mb/s")
                 # sub["packets"].sort()
-                plt.plot(sub["packets"], sub["cpu"], label=f"{kernel}")
-            plt.yticks(ticks(y_range, 10))
-            ax = plt.gca()
+                ax.plot(sub["packets"], sub["cpu"], label=f"{kernel}")
+            ax.set_yticks(ticks(y_range, 10))
             ax.yaxis.set_major_formatter('{x:9<5.1f}')
             ax.legend()
-            plt.savefig(f"../results/{results.machinename}-mt-{bw}-{protocol}-cpu.png")
+            save_plot(fig, f"../results/{results.machinename}-mt-{bw}-{protocol}-cpu.png")
 
 def iperf3_mt_pktsize_latency(results):
     """
@@ -346,7 +378,7 @@ def iperf3_mt_pktsize_latency(results):
     """
     for protocol in ["TCP"]:
         for bw in ["1000m"]:
-            plt.clf()
+            fig, ax = new_plot()
             y_range = []
             for kernel in results.kernels:
                 # print(f"Graphing {protocol}-{bw}-{kernel}")
@@ -359,17 +391,16 @@ def iperf3_mt_pktsize_latency(results):
                     if latency not in y_range:
                         y_range.append(latency)
                 
-                plt.xlabel("Packet sizes (bytes)")
-                plt.ylabel("Packet RTT (us)")
+                ax.set_xlabel("Packet sizes (bytes)")
+                ax.set_ylabel("Packet RTT (us)")
                 # plt.ticklabel_format(style='plain', axis='y', useOffset=False)
-                plt.title(f"{results.machinename} - MT Mean RTT latency (per-core) - {protocol} targeting {bw[:len(bw)-1]}Mb/s")
+                ax.set_title(f"{results.machinename} - MT Mean RTT latency (per-core) - {protocol} targeting {bw[:len(bw)-1]}Mb/s")
                 # sub["packets"].sort()
-                plt.plot(sub["packets"], sub["latency"], label=f"{kernel}")
-            plt.yticks(ticks(y_range, 10))
-            ax = plt.gca()
+                ax.plot(sub["packets"], sub["latency"], label=f"{kernel}")
+            ax.set_yticks(ticks(y_range, 10))
             ax.yaxis.set_major_formatter('{x:9<5.1f}')
             ax.legend()
-            plt.savefig(f"../results/{results.machinename}-mt-{bw}-{protocol}-latency.png")
+            save_plot(fig, f"../results/{results.machinename}-mt-{bw}-{protocol}-latency.png")
 
 def iperf3_st_bw_throughput(results, reverse, bidir):
     """
@@ -379,6 +410,8 @@ def iperf3_st_bw_throughput(results, reverse, bidir):
     if reverse:
         throughput_type = "throughput_receive"
     for tcp in [True, False]:
+        if not results.redraw(tcp, bidir):
+            continue
         label = "UDP"
         if tcp:
             label = "TCP"
@@ -389,7 +422,7 @@ def iperf3_st_bw_throughput(results, reverse, bidir):
             label += " bidir"
 
         print(f"{results.machinename} - ST {label} Throughtput - targeting 1000Mb/s")
-        plt.clf()
+        fig, ax = new_plot()
         y_largest_range = []
         tests_exist = False
         for kernel in results.kernels:
@@ -406,22 +439,23 @@ def iperf3_st_bw_throughput(results, reverse, bidir):
                 y_largest_range.append(element)
 
             print(test)
-            plt.plot(test["bws"], test[throughput_type], label=f"{kernel}")
+            line, = ax.plot(test["bws"], test[throughput_type], label=f"{kernel}")
+            precision_bars(ax, line, test["bws"], test, throughput_type)
         
         if not tests_exist: continue
         
-        plt.xlabel("Requested throughput (MBit/s)")
-        plt.ylabel("Actual Throughput (MBit/s)")
+        ax.set_xlabel("Requested throughput (MBit/s)")
+        ax.set_ylabel("Actual Throughput (MBit/s)")
         
-        plt.title(f"{results.machinename} - ST Throughtput vs BW - {label} targeting 1000Mb/s")
-        plt.yticks(ticks(y_largest_range, 10))
-        ax = plt.gca()
+        ax.set_title(f"{results.machinename} - ST Throughtput vs BW - {label} targeting 1000Mb/s")
+        ax.set_yticks(ticks(y_largest_range, 10))
         ax.yaxis.set_major_formatter('{x:9<5.1f}')
         ax.legend()
 
-        if bidir: throughput_type += "-bidir"
-        s = f"../results/{results.machinename}-st-1000m-bw-{label}-{throughput_type}.png"
-        plt.savefig(s)  
+        suffix = throughput_type
+        if bidir: suffix += "-bidir"
+        s = f"../results/{results.machinename}-st-1000m-bw-{label}-{suffix}.png"
+        save_plot(fig, s)  
         print(f"Saved {s}")
 
 def iperf3_mt_bw_throughput(results, reverse, bidir):
@@ -432,6 +466,8 @@ def iperf3_mt_bw_throughput(results, reverse, bidir):
     if reverse:
         throughput_type = "throughput_receive"
     for tcp in [True, False]:
+        if not results.redraw(tcp, bidir, "mt"):
+            continue
         label = "UDP"
         if tcp:
             label = "TCP"
@@ -442,13 +478,13 @@ def iperf3_mt_bw_throughput(results, reverse, bidir):
             label += " bidir"
 
         print(f"{results.machinename} - ST {label} Throughtput - targeting 1000Mb/s")
-        plt.clf()
+        fig, ax = new_plot()
         y_largest_range = []
         tests_exist = False
         for kernel in results.kernels:
             test = None
             if tcp:
-                test = results.get_mt_test_bw_udp(kernel, bidir)
+                test = results.get_mt_test_bw_tcp(kernel, bidir)
             else:
                 test = results.get_mt_test_bw_udp(kernel, bidir)
             if test == None:
@@ -459,22 +495,22 @@ def iperf3_mt_bw_throughput(results, reverse, bidir):
                 y_largest_range.append(element)
 
             print(test)
-            plt.plot(test["bws"], test[throughput_type], label=f"{kernel}")
+            ax.plot(test["bws"], test[throughput_type], label=f"{kernel}")
         
         if not tests_exist: continue
         
-        plt.xlabel("Requested throughput (MBit/s)")
-        plt.ylabel("Actual Throughput (MBit/s)")
+        ax.set_xlabel("Requested throughput (MBit/s)")
+        ax.set_ylabel("Actual Throughput (MBit/s)")
         
-        plt.title(f"{results.machinename} - MT Throughtput vs BW - {label} targeting 1000Mb/s")
-        plt.yticks(ticks(y_largest_range, 10))
-        ax = plt.gca()
+        ax.set_title(f"{results.machinename} - MT Throughtput vs BW - {label} targeting 1000Mb/s")
+        ax.set_yticks(ticks(y_largest_range, 10))
         ax.yaxis.set_major_formatter('{x:9<5.1f}')
         ax.legend()
 
-        if bidir: throughput_type += "-bidir"
-        s = f"../results/{results.machinename}-mt-1000m-bw-{label}-{throughput_type}.png"
-        plt.savefig(s)  
+        suffix = throughput_type
+        if bidir: suffix += "-bidir"
+        s = f"../results/{results.machinename}-mt-1000m-bw-{label}-{suffix}.png"
+        save_plot(fig, s)  
         print(f"Saved {s}")
 
 def iperf3_st_bw_cpu(results, bidir):
@@ -482,6 +518,8 @@ def iperf3_st_bw_cpu(results, bidir):
     Generates plots of throughput against target bandwidth for UDP/TCP results
     """
     for tcp in [True, False]:
+        if not results.redraw(tcp, bidir):
+            continue
         label = "UDP"
         if tcp:
             label = "TCP"
@@ -489,7 +527,7 @@ def iperf3_st_bw_cpu(results, bidir):
             label += " bidir"
 
         print(f"{results.machinename} - ST {label} CPU")
-        plt.clf()
+        fig, ax = new_plot()
 
         tests_exist = False
         for kernel in results.kernels:
@@ -502,19 +540,18 @@ def iperf3_st_bw_cpu(results, bidir):
                 continue
             tests_exist = True
 
-            plt.plot(test["bws"], test["cpu"], label=f"{kernel}")
+            ax.plot(test["bws"], test["cpu"], label=f"{kernel}")
         
         if not tests_exist: continue
         
-        plt.xlabel("Requested throughput (MBit/s)")
-        plt.ylabel("CPU utilisation (%)")
+        ax.set_xlabel("Requested throughput (MBit/s)")
+        ax.set_ylabel("CPU utilisation (%)")
         
-        plt.title(f"{results.machinename} - ST CPU utilisation vs BW - {label}")
-        ax = plt.gca()
+        ax.set_title(f"{results.machinename} - ST CPU utilisation vs BW - {label}")
         ax.yaxis.set_major_formatter('{x:9<5.1f}')
         ax.legend()
         s = f"../results/{results.machinename}-st-1000m-bw-{label}-cpu.png"
-        plt.savefig(s)  
+        save_plot(fig, s)  
         print(f"Saved {s}")
     
 def iperf3_st_bw_latency(results, bidir):
@@ -522,6 +559,8 @@ def iperf3_st_bw_latency(results, bidir):
     Generates plots of throughput against target bandwidth for UDP/TCP results
     """
     for tcp in [True, False]:
+        if not results.redraw(tcp, bidir):
+            continue
         label = "UDP"
         if tcp:
             label = "TCP"
@@ -529,7 +568,7 @@ def iperf3_st_bw_latency(results, bidir):
             label += " bidir"
 
         print(f"{results.machinename} - ST {label} CPU")
-        plt.clf()
+        fig, ax = new_plot()
 
         tests_exist = False
         for kernel in results.kernels:
@@ -542,19 +581,18 @@ def iperf3_st_bw_latency(results, bidir):
                 continue
             tests_exist = True
 
-            plt.plot(test["bws"], test["rtt"], label=f"{kernel}")
+            ax.plot(test["bws"], test["rtt"], label=f"{kernel}")
         
         if not tests_exist: continue
         
-        plt.xlabel("Requested throughput (MBit/s)")
-        plt.ylabel("Mean RTT (us)")
+        ax.set_xlabel("Requested throughput (MBit/s)")
+        ax.set_ylabel("Mean RTT (us)")
         
-        plt.title(f"{results.machinename} - ST Mean RTT vs BW - {label}")
-        ax = plt.gca()
+        ax.set_title(f"{results.machinename} - ST Mean RTT vs BW - {label}")
         ax.yaxis.set_major_formatter('{x:9<5.1f}')
         ax.legend()
         s = f"../results/{results.machinename}-st-1000m-bw-{label}-rtt.png"
-        plt.savefig(s)  
+        save_plot(fig, s)  
         print(f"Saved {s}")
 
 
@@ -606,107 +644,68 @@ def iperf3_filesort(file):
 
 
 class iperf_results():
-    def __init__(self, out_dir, machine_name):
+    def __init__(self, out_dir, machine_name, changes=None):
         """
-        Take location, collate tests.
-
-        Dict formats for st/mt tests:
-        {
-            kernel1 : {
-                bandwidth : [tests sorted by packet size],
-                bandwidth1 : ...
-                ...
-            } ... 
-
-        }
-
-        For MT, there is another array wrapping above this structure
-
-        Tests:
-        {
-            "packet_sz" : packet size,
-            "bw" : target bandwidth,
-            "rtt" : mean rtt,
-            "cpu" : target cpu utilisation (mean)
-            "throughput_send": mean throughput over all runs, sender. If monodirectional test this becomes only field for tp.
-            "throughput_receive": mean throughput over all runs, receiver.
-            "raw" : raw json of test
-            "bidir" : True if this test is bidirectional
-        }
+        Take location, collate tests from the result index (see resultdb).
+        If changes from an earlier ingest are given, redraw() says whether a plot is affected by
+        them (or by anything ingested now). Otherwise everything is redrawn.
+
+        Tests are kept in a columnar table (see resulttable), one row per test with columns
+        kernel, protocol, mode, bidir, thread, bw, pktsize, throughput_send, throughput_receive,
+        cpu, rtt, duration and precision. udp_st_tests, tcp_st_tests, udp_mt_tests and
+        tcp_mt_tests are slices of it. MT tests are combined across threads when queried (see
+        resulttable.mt_aggregate).
+
+        Throughputs are in MBit/s. throughput_receive is only set for bidirectional tests.
+        duration is how long a test ran and precision how precise its throughput got, for runs
+        which could stop early (see earlystop).
         """
-        self.udp_st_tests = {}
-        self.udp_mt_tests = []
-        self.tcp_st_tests = {}
-        self.tcp_mt_tests = []
         self.kernels = []
         self.machinename = machine_name
-        # Find all tests
-        for kernel in os.listdir(f"{out_dir}/{machine_name}"):
-            self.kernels.append(kernel)
-            for iperf_out in os.listdir(f"{out_dir}/{machine_name}/{kernel}"):
-                if not ".test" in iperf_out or not "iperf3" in iperf_out:
-                    continue
-                with open(f"{out_dir}/{machine_name}/{kernel}/{iperf_out}") as f:
-                    try:
-                        result = json.load(f)
-                    except:
-                        print(f"Failed to open {machine_name} - {kernel} {iperf_out}")
-                        continue
-
-                    if len(result["intervals"]) == 0:
-                        print(f"Test {machine_name} - {kernel} {iperf_out} failed to run. Skipping.")
-                        continue
-                    
-                    # extract bandwidth
-                    bw = iperf_out.split("-")[3].split("m")[0]
-                    protocol = iperf_out.split("-")[2].split(".")[0]
-                    test = {}
-
-                    # throughput variables -> extracted here to minimise copy pasta due to bidir handling
-                    throughput_send = 0.0
-                    throughput_receive = 0.0
-                    if "bidir" in iperf_out.split("-")[2]:
-                        throughput_send = float(result["end"]["sum_sent"]["bits_per_second"] / (10**6))
-                        throughput_receive = float(result["end"]["sum_sent_bidir_reverse"]["bits_per_second"] / (10**6))
-                    else:
-                        throughput_send = float(result["end"]["sum_sent"]["bits_per_second"] / (10**6))
-                    
-                    # cpu
-                    cpu = result["end"]["cpu_utilization_percent"]["host_total"]
-
-                    # rtt
-                    rtt = 0.0
-                    if protocol == "tcp":
-                        rtt = result["end"]["streams"][0]["sender"]["mean_rtt"]
-                    else:
-                        rtt = float(result["end"]["sum"]["jitter_ms"]) * 2000.0
-
-                    test = {
-                        "packet_sz" : iperf_out.split("-")[4].split(".")[0],
-                        "bw" : bw,
-                        "rtt" : rtt,
-                        "cpu" : cpu,
-                        "throughput_send" : throughput_send,
-                        "throughput_receive" : throughput_receive,
-                        # "raw" : result,
-                        "bidir" : ("bidir" in iperf_out.split("-")[2])
-                    }
-                    
-                    # check for mt/st
-                    if iperf_out.split("-")[1] == "st":
-                        # protocol
-                        print(protocol)
-                        if protocol == "udp":
-                            self.udp_st_tests = self.append_dict(self.udp_st_tests, test, bw, -1, kernel)
-                        else:
-                            self.tcp_st_tests = self.append_dict(self.tcp_st_tests, test, bw, -1, kernel)
-                    else:
-                        mt_num = int(iperf_out.split("-")[1].split("mt")[1]) - 1
-                        if protocol == "udp":
-                            self.udp_mt_tests = self.append_dict(self.udp_mt_tests, test, bw, mt_num, kernel)
-                        else:
-                            self.tcp_mt_tests = self.append_dict(self.tcp_mt_tests, test, bw, mt_num, kernel)
 
+        # Index any new result files, then pull every test from the index
+        db = resultdb.connect(out_dir)
+        self.changes = resultdb.ingest(db, out_dir, machine_name)
+        if changes is not None:
+            self.changes = changes + self.changes
+        else:
+            self.changes = None
+        self.kernels = resultdb.kernels(db, machine_name)
+        self.table = resulttable.load(db, machine_name)
+        db.close()
+
+        self.udp_st_tests = self.table.select(protocol="udp", mode="st")
+        self.tcp_st_tests = self.table.select(protocol="tcp", mode="st")
+        self.udp_mt_tests = self.table.select(protocol="udp", mode="mt")
+        self.tcp_mt_tests = self.table.select(protocol="tcp", mode="mt")
+
+        # Fixed bandwidth sweeps plot as evenly spaced categories. Adaptive sweeps (see
+        # saturation) cluster their bandwidths around the knee, so those need a linear axis.
+        swept = self.table.select(pktsize=MAX_PKT_SZ)["bw"]
+        self.linear_bw = not set(swept.tolist()) <= set(FIXED_BWS)
+
+    def bw_axis(self, bws):
+        """
+        INTERNAL
+        Bandwidths as x values, see linear_bw.
+        """
+        if self.linear_bw:
+            return [int(b) for b in bws]
+        return [str(b) for b in bws]
+
+    def redraw(self, tcp, bidir, mode="st"):
+        """
+        True if plots of tcp/udp, bidir/unidir tests need regenerating.
+        """
+        if self.changes is None:
+            return True
+        protocol = "udp"
+        if tcp:
+            protocol = "tcp"
+        for c in self.changes:
+            if c["kind"] == "iperf3" and c["protocol"] == protocol and c["bidir"] == bidir and c["mode"] == mode:
+                return True
+        return False
 
     # x vs packet size tests
 
@@ -734,137 +733,83 @@ class iperf_results():
         """
         return self.get_mt_test_pktsize(kernel, self.tcp_mt_tests, bidir)
 
-    def get_mt_tests_pktsize(self, kernel, in_list, bidir):
+    def get_mt_test_pktsize(self, kernel, in_list, bidir, how="sum"):
         """
         INTERNAL
-        Return tests of packet size vs. achieved throughput for. Sorted by packet size
-        
-        Let this function show my committedness to avoiding degenerate data.
+        Return MT tests of packet size vs. achieved throughput, combined across threads. Sorted by
+        packet size. Threads with missing tests are left out of the packet sizes they are missing.
         """
+        tests = in_list.select(kernel=kernel)
+        if len(tests) == 0:
+            print(f"WARNING: no MT tests for kernel {kernel}")
+            return None
+
+        # The packet size sweep is the bw with the most tests per thread
+        bws, counts = tests.select(thread=tests["thread"].min()).counts("bw")
+        if counts.max() <= 2:
+            print(f"WARNING: didn't find MT test batch with appropriate length for pktsize for kernel {kernel}")
+            return None
+        tests = tests.select(bw=bws[np.argmax(counts)], bidir=bidir)
 
-        results = []
-        out = []
-        safe = ([], [])
-        for mt in in_list:
-            r = (self.get_tests_pktsz(kernel, in_list[mt], bidir))
-            results.append(r)
-            # Find longest entry - we treat this one as the one with the maximal set of packet sizes
-            # in case others have missing tests.
-            if len(r[0]) > len(safe[0]):
-                safe = r
-
-        # Sanitise data
-        rr = results.copy()
-        for mt in rr:
-            for test in mt:
-                # Check if this test has the wrong number of tests
-                l = test["test"]
-                if len(l) != len(safe["test"]):
-                    new = safe["test"].copy()
-                    # If so, create dummy list with extra elements to pad. First find bad elements by
-                    # checking packet sizes
-                    bad_indices = []
-                    for pkt_sz in safe["pkts"]:
-                        if pkt_sz not in test["pkts"]:
-                            bad_indices.append(safe["pkts"].index(pkt_sz))
-                    
-                    # Populate new lists
-                    c = 0
-                    for i in range(new):
-                        if i in bad_indices:
-                            new[i] = -1
-                        else:
-                            new[i] = l[c]
-                            c += 1
-                    l = new
-                    results[rr.index(mt)] = l
-        # Average data
-        for mt in results:
-            out = self.mt_combine(mt, out)
-
-        return (out, safe[1])
-
-
-    def mt_combine(list1, list2, mode): 
+        out = self.mt_combine(tests, "pktsize", how)
+        out["pkt_szs"] = out.pop("xs")
+        if not bidir:
+            out["throughput_receive"] = []
+        return out
+
+    def mt_combine(self, tests, x, how):
         """
-        Average/sum each element of two test sets. An element with value -1 is ignored.
+        INTERNAL
+        Combine MT tests across threads for each value of x (bw or pktsize). Throughput is
+        combined with how (see resulttable.mt_aggregate), cpu and rtt are averaged.
+        Returns the output dict format of get_tests_bw/get_tests_pktsz, x values as strings.
         """
-        if list1 == []:
-            return list2
-        elif list2 == []:
-            return list1
-
-        if len(list1) != len(list2):
-            print("Failed to piecewise mean lists - wrong length!")
-            raise ValueError
-        
-        out = []
-        for i in range(len(list1)):
-            if list1[i] != -1 and list2[i] != -1:
-                if mode == "mean":
-                    out.append(int((list1[i] + list2[i])/2))
-                elif mode == "sum":
-                    out.append(int((list1[i] + list2[i])))
-            else:
-                out.append(max(list1[i], list2[i]))
+        out = {}
+        for column, agg in [("throughput_send", how), ("throughput_receive", how), ("cpu", "mean"), ("rtt", "mean")]:
+            groups, values = resulttable.mt_aggregate(tests, (x,), column, agg)
+            ran = ~np.ma.getmaskarray(values)
+            out[column] = values[ran].tolist()
+        out["xs"] = [str(v) for v in groups[x][ran]]
         return out
 
     def get_tests_pktsz(self, kernel, in_list, bidir):
         """
         INTERNAL
-        Get tests given internal list. This function is wrapped around by the targeted ones
+        Get tests given internal table. This function is wrapped around by the targeted ones
         """
         out = {
             "pkt_szs" : [],
             "throughput_send" : [],
             "cpu" : [],
             "throughput_receive" : [],   
-            "rtt" : []
+            "rtt" : [],
+            "precision" : []
         }
-        bw = None
-        try:
-            for bww in in_list[kernel]:
-                """
-                There should only be one bw with more than one test
-                """
-                if len(in_list[kernel][bww]) > 2:
-                    bw = bww
-                    print(f"Selected bw {bw}")
-                    break
-        except KeyError:
+        tests = in_list.select(kernel=kernel)
+        if len(tests) == 0:
             print(f"WARNING: no tests for kernel {kernel}")
             return None
+
+        # There should only be one bw with more than one test
+        bw = None
+        bws, counts = tests.counts("bw")
+        if (counts > 2).any():
+            bw = bws[np.argmax(counts > 2)]
+            print(f"Selected bw {bw}")
         if bw == None:
             print(f"WARNING: didn't find test batch with appropriate length for pktsize for\
  kernel {kernel}")
             return None
-        
-        tests = []
-
-        # Collect tests
-        for test in in_list[kernel][bw]:
-            # !xor bidir conditions
-            if (bidir and test["bidir"]) or (not bidir and not test["bidir"]):
-                tests.append(test)
-        # Sort
-        tests.sort(key= lambda t: int(t["packet_sz"]))
-        print(f"FIRST STAGE: {tests}")
-
-        # Extract packet sizes and return separately
-        pkt_szs = []
-        for t in tests:
-            out["pkt_szs"].append(t["packet_sz"])
-            out["throughput_send"].append(t["throughput_send"])
-            if t["bidir"]:
-                out["throughput_receive"].append(t["throughput_receive"])
-
-            out["cpu"].append(t["cpu"])
-            try:
-                out["rtt"].append(t["rtt"])
-            except KeyError:
-                continue
-            
-        
+
+        tests = tests.select(bw=bw, bidir=bidir).sort("pktsize")
+        # Packet sizes are returned as strings so they plot as categories
+        out["pkt_szs"] = [str(p) for p in tests["pktsize"]]
+        out["throughput_send"] = tests["throughput_send"].tolist()
+        if bidir:
+            out["throughput_receive"] = tests["throughput_receive"].tolist()
+        out["cpu"] = tests["cpu"].tolist()
+        out["rtt"] = tests["rtt"].tolist()
+        out["precision"] = tests["precision"].tolist()
         return out
 
     # x vs bandwidth tests
@@ -872,107 +817,77 @@ class iperf_results():
     def get_tests_bw(self, kernel, in_list, bidir):
         """
         INTERNAL
-        Get tests given internal list. This function is wrapped around by the targeted ones
+        Get tests given internal table. This function is wrapped around by the targeted ones
         """
         out = {
             "bws" : [],
             "throughput_send" : [],
             "cpu" : [],
             "throughput_receive" : [],   
-            "rtt" : []
+            "rtt" : [],
+            "precision" : []
         }
-
-        num_bws = 0
-        try:
-            for bww in in_list[kernel]:
-                num_bws += 1
-
-        except KeyError:
+        tests = in_list.select(kernel=kernel)
+        if len(tests) == 0:
             print(f"WARNING: no tests for kernel {kernel}")
             return None
         
-        if num_bws < 2:
+        if len(tests.unique("bw")) < 2:
             print(f"WARNING: not enough tests bw graphs for kernel {kernel}")
             return None
 
-        tests = []
-        # Collect tests
-        for bw in in_list[kernel]:
-            for test in in_list[kernel][bw]:
-                if test["packet_sz"] == str(MAX_PKT_SZ):
-                    # !xor bidir conditions
-                    if (bidir and test["bidir"]) or (not bidir and not test["bidir"]):        
-                        tests.append(test)
-        if tests == []: return None
-
-        # Sort
-        tests.sort(key= lambda t: int(t["bw"]))
-
-        # Extract packet sizes and return separately
-        pkt_szs = []
-        for t in tests:
-            out["bws"].append(t["bw"])
-            out["throughput_send"].append(t["throughput_send"])
-            if t["bidir"]:
-                out["throughput_receive"].append(t["throughput_receive"])
-
-            out["cpu"].append(t["cpu"])
-            try:
-                out["rtt"].append(t["rtt"])
-            except KeyError:
-                continue
+        tests = tests.select(pktsize=MAX_PKT_SZ, bidir=bidir).sort("bw")
+        if len(tests) == 0: return None
 
+        # Bandwidths are returned as strings so they plot as categories, unless adaptive
+        out["bws"] = self.bw_axis(tests["bw"])
+        out["throughput_send"] = tests["throughput_send"].tolist()
+        if bidir:
+            out["throughput_receive"] = tests["throughput_receive"].tolist()
+        out["cpu"] = tests["cpu"].tolist()
+        out["rtt"] = tests["rtt"].tolist()
+        out["precision"] = tests["precision"].tolist()
         return out
     
-    def get_mt_test_bw(self, kernel, in_list, bidir):
+    def get_mt_test_bw(self, kernel, in_list, bidir, how="sum"):
         """
         INTERNAL
-        Return tests of bandwidth vs. achieved throughput for. Sorted by bandwidth
-        
-        Let this function show my committedness to avoiding degenerate data.
+        Return MT tests of bandwidth vs. achieved throughput, combined across threads. Sorted by
+        bandwidth. Threads with missing tests are left out of the bandwidths they are missing.
         """
+        tests = in_list.select(kernel=kernel)
+        if len(tests) == 0:
+            print(f"WARNING: no MT tests for kernel {kernel}")
+            return None
+        if len(tests.unique("bw")) < 2:
+            print(f"WARNING: not enough MT tests bw graphs for kernel {kernel}")
+            return None
 
-        results = []
-        out = []
-        safe = ([], [])
-        for mt in in_list:
-            r = self.get_tests_bw(kernel, in_list[mt], bidir)
-            results.append(r)
-            # Find longest entry - we treat this one as the one with the maximal set of packet sizes
-            # in case others have missing tests.
-            if len(r[0]) > len(safe[0]):
-                safe = r
-
-        # Sanitise data
-        rr = results.copy()
-        for mt in rr:
-            for test in mt:
-                # Check if this test has the wrong number of tests
-                l = test["test"]
-                if len(l) != len(safe["test"]):
-                    new = safe["test"].copy()
-                    # If so, create dummy list with extra elements to pad. First find bad elements by
-                    # checking packet sizes
-                    bad_indices = []
-                    for bw in safe["bw"]:
-                        if bw not in test["bw"]:
-                            bad_indices.append(safe["bw"].index(bw))
-                    
-                    # Populate new lists
-                    c = 0
-                    for i in range(new):
-                        if i in bad_indices:
-                            new[i] = -1
-                        else:
-                            new[i] = l[c]
-                            c += 1
-                    l = new
-                    results[rr.index(mt)] = l
-        # Average data
-        for mt in results:
-            out = self.mt_combine(mt, out)
-
-        return (out, safe[1])
+        tests = tests.select(pktsize=MAX_PKT_SZ, bidir=bidir)
+        if len(tests) == 0: return None
+
+        out = self.mt_combine(tests, "bw", how)
+        out["bws"] = self.bw_axis(out.pop("xs"))
+        if not bidir:
+            out["throughput_receive"] = []
+        return out
+
+    def get_mt_result(self, bw, udp, kernel):
+        """
+        Return unidirectional MT tests at bw (e.g. "1000m") by packet size: aggregate throughput,
+        mean CPU and mean latency per core.
+        """
+        tests = self.tcp_mt_tests
+        if udp:
+            tests = self.udp_mt_tests
+        tests = tests.select(kernel=kernel, bw=int(bw[:-1]), bidir=False)
+        out = self.mt_combine(tests, "pktsize", "sum")
+        return {
+            "packets" : out["xs"],
+            "throughput" : out["throughput_send"],
+            "cpu" : out["cpu"],
+            "latency" : out["rtt"]
+        }
 
     def get_st_test_bw_udp(self, kernel, bidir):
         """
@@ -998,60 +913,25 @@ class iperf_results():
         """
         return self.get_mt_test_bw(kernel, self.tcp_mt_tests, bidir)
 
-    def append_dict(self, target, test, bw, mt, kernel):
-        """
-        Append a test to an internal dict. Returns the modified dict
-        """
-
-        # ST case
-        if mt == -1:
-            # Check that target kernel exists
-            try:
-                _ = target[kernel]
-            except KeyError:
-                target[kernel] = {}
-            
-            # Check that target bw exists
-            try:
-                _ = target[kernel][bw]
-            except KeyError:
-                target[kernel][bw] = []
-
-            # Insert
-            target[kernel][bw].append(test)
-        
-        # MT case
-        else:
-            # Check if we have at least n entries in the MT array
-            while len(target) <= mt:
-                target.append({})
-            
-            # Check that target kernel exists
-            try:
-                _ = target[mt][kernel]
-            except KeyError:
-                target[mt][kernel] = {}
-            
-            # Check that target bw exists
-            try:
-                _ = target[mt][kernel][bw]
-            except KeyError:
-                target[mt][kernel][bw] = []
-
-            # Insert
-            target[mt][kernel][bw].append(test)
-
-        return target
-
 
 # For testingg
 if __name__ == "__main__":
     out_dir = "/home/mattr/tor-scripts/kernelmark/output"
     import sys
     if len(sys.argv) < 3:
-        print("USAGE: finalise.py [machine] [test1] ... [test n] \n tests: ipbench, iperf3")
+        print("USAGE: finalise.py [machine] [test1] ... [test n] [incremental]\n tests: ipbench, iperf3, ingest")
     
+    # Incremental: index new results once, then only redraw what they affect
+    changes = None
+    if "ingest" in sys.argv or "incremental" in sys.argv:
+        db = resultdb.connect(out_dir)
+        changes = resultdb.ingest(db, out_dir, sys.argv[1])
+        db.close()
+    if "incremental" not in sys.argv:
+        changes = None
+
     if "ipbench" in sys.argv:
-        finalise_ipbench(out_dir, sys.argv[1])
+        finalise_ipbench(out_dir, sys.argv[1], True, changes)
+        finalise_ipbench(out_dir, sys.argv[1], False, changes)
     if "iperf3" in sys.argv:
-        finalise_iperf3(out_dir, sys.argv[1])
+        finalise_iperf3(out_dir, sys.argv[1], changes)
@@ -0,0 +1,178 @@
+# generators
+#   Lease based allocator for the shared load generators (vb01-vb10). Tests ask for N generators
+#   and get a lease on N free hosts plus a range of iperf3 ports on their target. Several targets
+#   may be tested at once, by different processes, and two tests driving one host would silently
+#   halve the measured throughput. Leases live in a file guarded by a file lock, expire unless
+#   renewed, and are reclaimed when their owner has died.
+# 10/2026
+
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+HOSTS = [f"vb{str(i).zfill(2)}.keg.cse.unsw.edu.au" for i in range(1, 11)]
+LOCK_DIR = "/tmp/kernelmark-generators"
+PORT_BASE = 5000        # first iperf3 server port on a target
+PORTS_PER_TARGET = 8    # iperf3 server ports a target may run
+ACQUIRE_TIMEOUT = 3600  # seconds to wait for enough free generators
+LEASE_TTL = 120         # seconds a lease lasts without being renewed
+POLL_INTERVAL = 0.5
+
+
+class Lease():
+    def __init__(self, record):
+        self.id = record["id"]
+        self.hosts = record["hosts"]
+        self.target = record["target"]
+        self.ports = record["ports"]
+
+
+@contextmanager
+def locked():
+    """
+    Hold the lease file lock and yield the current leases (dict of id -> record). Changes to the
+    dict are written back on exit.
+    """
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    with open(f"{LOCK_DIR}/leases.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(f"{LOCK_DIR}/leases.json") as f:
+                leases = json.load(f)
+        except (OSError, ValueError):
+            leases = {}
+
+        yield leases
+
+        with open(f"{LOCK_DIR}/leases.json.tmp", "w") as f:
+            json.dump(leases, f, indent=4)
+        os.replace(f"{LOCK_DIR}/leases.json.tmp", f"{LOCK_DIR}/leases.json")
+        fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def alive(record):
+    """
+    False if the lease has expired or its owner is known to be dead.
+    """
+    if record["expires"] < time.time():
+        return False
+    if record["owner_host"] == socket.gethostname():
+        try:
+            os.kill(record["pid"], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+    return True
+
+
+def reclaim(leases):
+    for lease_id in list(leases):
+        if not alive(leases[lease_id]):
+            print(f"Reclaiming stale lease on {', '.join(leases[lease_id]['hosts'])}")
+            del leases[lease_id]
+
+
+def try_acquire(n, target, num_ports, ttl):
+    """
+    Take a lease on n free hosts and num_ports free ports on target, or return None if there
+    aren't enough.
+    """
+    with locked() as leases:
+        reclaim(leases)
+
+        busy_hosts = set()
+        busy_ports = set()
+        for record in leases.values():
+            busy_hosts.update(record["hosts"])
+            if record["target"] == target:
+                busy_ports.update(record["ports"])
+
+        hosts = [h for h in HOSTS if h not in busy_hosts][:n]
+        if len(hosts) < n:
+            return None
+
+        # Contiguous port range on the target
+        ports = None
+        for base in range(PORT_BASE, PORT_BASE + PORTS_PER_TARGET - num_ports + 1):
+            candidate = list(range(base, base + num_ports))
+            if busy_ports.isdisjoint(candidate):
+                ports = candidate
+                break
+        if ports is None:
+            return None
+
+        record = {
+            "id" : uuid.uuid4().hex,
+            "hosts" : hosts,
+            "target" : target,
+            "ports" : ports,
+            "pid" : os.getpid(),
+            "owner_host" : socket.gethostname(),
+            "expires" : time.time() + ttl
+        }
+        leases[record["id"]] = record
+        return Lease(record)
+
+
+def renew(lease, ttl):
+    with locked() as leases:
+        if lease.id in leases:
+            leases[lease.id]["expires"] = time.time() + ttl
+            return True
+        return False
+
+
+def release(lease):
+    with locked() as leases:
+        leases.pop(lease.id, None)
+
+
+@contextmanager
+def lease(n, target, num_ports=None, timeout=ACQUIRE_TIMEOUT, ttl=LEASE_TTL):
+    """
+    Lease n load generators and num_ports (default n) iperf3 ports on target for the duration of
+    the with block. Yields a Lease, or None if none could be had within timeout. The lease is
+    renewed in the background while held.
+    """
+    if num_ports is None:
+        num_ports = n
+    if n > len(HOSTS) or num_ports > PORTS_PER_TARGET:
+        print(f"Can't lease {n} load generators and {num_ports} ports! "
+              f"Max={len(HOSTS)} generators, {PORTS_PER_TARGET} ports")
+        yield None
+        return
+
+    deadline = time.time() + timeout
+    waiting = False
+    l = try_acquire(n, target, num_ports, ttl)
+    while l is None and time.time() < deadline:
+        if not waiting:
+            print(f"Waiting for {n} free load generators...")
+            waiting = True
+        time.sleep(POLL_INTERVAL)
+        l = try_acquire(n, target, num_ports, ttl)
+    if l is None:
+        print(f"Timed out waiting for {n} load generators.")
+        yield None
+        return
+
+    done = threading.Event()
+    def heartbeat():
+        while not done.wait(ttl / 3):
+            if not renew(l, ttl):
+                print(f"WARNING: lease on {', '.join(l.hosts)} was reclaimed")
+                return
+    t = threading.Thread(target=heartbeat, daemon=True)
+    t.start()
+    try:
+        yield l
+    finally:
+        done.set()
+        t.join()
+        release(l)
@@ -0,0 +1,335 @@
+# ipbenchctl
+#   In-process ipbench controller. Runs a whole sweep of latency tests from one process through
+#   the ipbench_client/ipbench_target bindings, where runbench starts a fresh ipbench front end
+#   (and re-imports and re-loads its plugins) for every point. Talks the same protocol to the
+#   ipbenchd daemons as the front end and hands each point back as a record (see runlog) as soon
+#   as it finishes, while still writing a runbench style log.
+# 10/2026
+
+import ctypes
+import os
+import re
+import select
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import runlog
+
+TEST = "latency"
+TARGET_TEST = "cpu_target"
+DAEMON_PORT = 8036          # ipbenchd on the clients
+TARGET_DAEMON_PORT = 8037   # ipbenchd -t on the target
+CONNECT_TIMEOUT = 10
+
+# Test parameters, as in runbench
+SOCKTYPE = "udp"
+TEST_PORT = 1235
+IFACE = "enp3s0"
+WARMUP = 10
+COOLDOWN = 6
+HOLDOFF = 100000
+DURATION = 10           # seconds per point
+FRAME_OVERHEAD = 38     # ethernet bytes on the wire per packet on top of the payload
+BWPEAKS = [i * 100000000 for i in range(1, 10)]
+PKTSIZES = [1472]
+
+
+class IpbenchError(Exception):
+    pass
+
+
+class Daemon():
+    """
+    Control connection to the ipbenchd on a client, or on the target if id is None. One test
+    per connection - the daemon hangs up once it has sent its results.
+    """
+    def __init__(self, hostname, port, test, plugin, id=None):
+        self.hostname = hostname
+        self.port = port
+        self.test = test
+        self.plugin = plugin
+        self.id = id
+        self.s = None
+        self.f = None
+
+    # for select()
+    def fileno(self):
+        return self.s.fileno()
+
+    def status(self):
+        """
+        Read a "123 STRING (message)" status line. Returns (code, message).
+        """
+        line = self.f.readline().decode("utf-8", errors="ignore").strip()
+        if line == "":
+            raise IpbenchError(f"{self.hostname} closed the connection")
+        r = re.match(r"(\d{3}) ([^(]*)(?:\((.*)\))?", line)
+        if r is None:
+            raise IpbenchError(f"Bad status from {self.hostname}: {line}")
+        return int(r.group(1)), (r.group(3) or r.group(2)).strip()
+
+    def command(self, cmd, expect=200):
+        self.s.sendall((cmd + "\n").encode("utf-8"))
+        if expect is None:
+            return
+        code, msg = self.status()
+        if code != expect:
+            raise IpbenchError(f"{cmd.split()[0]} to {self.hostname} failed ({code} {msg})")
+
+    def connect(self, reset=False):
+        """
+        Connect and load the test. If reset, first abort whatever the daemon was running.
+        """
+        try:
+            self.s = socket.create_connection((self.hostname, self.port), CONNECT_TIMEOUT)
+        except OSError as e:
+            raise IpbenchError(f"Can't connect to {self.hostname} on port {self.port}: {e}")
+        self.s.settimeout(None)
+        self.f = self.s.makefile("rb")
+        code, msg = self.status()
+        if code != 100:
+            raise IpbenchError(f"{self.hostname} isn't an ipbench daemon ({code} {msg})")
+
+        if reset:
+            # the daemon closes the connection after an ABORT - re-open
+            self.command("ABORT", None)
+            self.close()
+            return self.connect()
+        self.command("HELLO")
+        self.command(f"LOAD {self.test}")
+
+    def setup(self, args, target=None, port=0):
+        if self.id is None:
+            self.command(f'SETUP args::"{args}"')
+        else:
+            self.command(f'SETUP target::{target}||port::{port}||args::"{args}"')
+
+    def start(self):
+        # the reply comes with the results, see unmarshall
+        self.command("START", None)
+
+    def stop(self):
+        self.command("STOP", None)
+
+    def unmarshall(self):
+        """
+        Read the test results and pass them to the plugin.
+        """
+        code, msg = self.status()
+        if code not in (220, 221):
+            raise IpbenchError(f"Test on {self.hostname} failed: {msg}")
+        header = self.f.readline().decode("ascii", errors="ignore")
+        r = re.match(r"Content-length: (\d+)", header)
+        if r is None:
+            raise IpbenchError(f"Invalid Content-length from {self.hostname}")
+        data = self.f.read(int(r.group(1)))
+        if len(data) != int(r.group(1)):
+            raise IpbenchError(f"{self.hostname} closed the connection mid-result")
+
+        valid = (code == 220)
+        if self.id is None:
+            self.plugin.unmarshall(data, valid)
+        else:
+            self.plugin.unmarshall(self.id, data, valid)
+
+    def close(self):
+        if self.s is None:
+            return
+        try:
+            self.s.sendall(b"QUIT\n")
+        except OSError:
+            pass
+        self.f.close()
+        self.s.close()
+        self.s = None
+
+
+def captured(fn):
+    """
+    Call fn and return what it printed. The plugins print their results from C, so this swaps out
+    the stdout file descriptor rather than sys.stdout.
+    """
+    sys.stdout.flush()
+    libc = ctypes.CDLL(None)
+    saved = os.dup(1)
+    with tempfile.TemporaryFile() as tmp:
+        os.dup2(tmp.fileno(), 1)
+        try:
+            fn()
+        finally:
+            libc.fflush(None)
+            os.dup2(saved, 1)
+            os.close(saved)
+        tmp.seek(0)
+        return tmp.read().decode("utf-8", errors="replace")
+
+
+def point_args(bwpeak, pktsize, num_clients, socktype=SOCKTYPE):
+    """
+    Per client rate and test arguments for one point, worked out the way runbench does: bwpeak
+    is the total on the wire, split between the clients.
+    """
+    bps = (pktsize * bwpeak) // ((pktsize + FRAME_OVERHEAD) * num_clients)
+    samples = DURATION * bps // pktsize // 8
+    args = (f"bps={bps},size={pktsize},socktype={socktype},samples={samples},"
+            f"warmup={WARMUP},cooldown={COOLDOWN},iface={IFACE}")
+    return bps, args
+
+
+class Controller():
+    def __init__(self, clients, test_target, target_host=None, socktype=SOCKTYPE, log=None):
+        """
+        Controller for latency tests from clients (load generator hostnames) against test_target,
+        the target's address on the test network. If target_host (the target's control address)
+        is given, cpu_target runs on the target alongside each test. The plugins are loaded once
+        here for every point. Everything runbench would print goes to log, if given (see begin).
+        Raises ImportError if the bindings aren't installed.
+        """
+        import ipbench_client
+        self.client_plugin = ipbench_client
+        self.client_plugin.load_plugin(TEST)
+        self.target_plugin = None
+        if target_host is not None:
+            import ipbench_target
+            self.target_plugin = ipbench_target
+            self.target_plugin.load_plugin(TARGET_TEST)
+
+        self.clients = clients
+        self.test_target = test_target
+        self.target_host = target_host
+        self.socktype = socktype
+        self.test_port = TEST_PORT
+        self.log = None
+        self.parser = runlog.LogParser()
+        # clear out tests left running by anything before us, once
+        self.reset = True
+        if log is not None:
+            self.begin(log)
+
+    def begin(self, log):
+        """
+        Start logging to log, with runbench's header.
+        """
+        self.log = log
+        numbers = " ".join(h.split(".")[0][2:] for h in self.clients)
+        self.emit(f"IP benchmark run at {time.ctime()}\n"
+                  f"Target={self.target_host} \n"
+                  f"Using VBs numbers: {numbers}\n"
+                  f"Test = {TEST}\n"
+                  f"Type = {self.socktype}\n"
+                  f"Using warmup {WARMUP} cooldown {COOLDOWN}\n")
+
+    def emit(self, text):
+        """
+        Log text and parse it. Returns the last record it held, if any.
+        """
+        if self.log is not None:
+            self.log.write(text)
+            self.log.flush()
+        record = None
+        for line in text.splitlines():
+            r = self.parser.feed(line)
+            if r is not None:
+                record = r
+        return record
+
+    def connect(self, hostname, id, args):
+        d = Daemon(hostname, DAEMON_PORT, TEST, self.client_plugin, id)
+        try:
+            d.connect(self.reset)
+            d.setup(args, self.test_target, self.test_port)
+        except Exception:
+            d.close()
+            raise
+        return d
+
+    def run(self, args):
+        """
+        Run one test with the given client test arguments. Returns what the plugins printed.
+        """
+        target = None
+        clients = []
+        try:
+            self.client_plugin.setup_controller(len(self.clients), None)
+            if self.target_plugin is not None:
+                self.target_plugin.setup_controller(None)
+                target = Daemon(self.target_host, TARGET_DAEMON_PORT, TARGET_TEST, self.target_plugin)
+                target.connect(self.reset)
+                target.setup(f"warmup={WARMUP},cooldown={COOLDOWN},holdoff={HOLDOFF}")
+
+            # set the clients up all at once
+            with ThreadPoolExecutor(len(self.clients)) as pool:
+                futures = [pool.submit(self.connect, h, i, args) for i, h in enumerate(self.clients)]
+                for f in futures:
+                    if f.exception() is None:
+                        clients.append(f.result())
+                for f in futures:
+                    f.result()
+            self.reset = False
+
+            # target test first
+            if target is not None:
+                target.start()
+            for c in clients:
+                c.start()
+
+            waiting = list(clients)
+            while waiting != []:
+                ready, _, _ = select.select(waiting, [], [], 0.2)
+                for c in ready:
+                    c.unmarshall()
+                    waiting.remove(c)
+                # anything from the target before it's stopped is an error
+                if target is not None and select.select([target], [], [], 0)[0] != []:
+                    raise IpbenchError(f"Target returned an error: {target.status()[1]}")
+
+            if target is not None:
+                target.stop()
+                target.unmarshall()
+
+            out = captured(self.client_plugin.output)
+            if target is not None:
+                out += captured(self.target_plugin.output)
+            return out
+        finally:
+            for d in clients + [target]:
+                if d is not None:
+                    d.close()
+
+    def measure(self, bwpeak, pktsize):
+        """
+        Run one point: bwpeak bits/s in total from all clients, in packets of pktsize.
+        Returns its record, or None if the test failed.
+        """
+        bps, args = point_args(bwpeak, pktsize, len(self.clients), self.socktype)
+        self.emit(f"{bps} test started!\n")
+        try:
+            out = self.run(args)
+        except (IpbenchError, RuntimeError, OSError) as e:
+            print(f"Ipbench failed : {e}")
+            return None
+        return self.emit(out)
+
+    def sweep(self, bwpeaks=BWPEAKS, pktsizes=PKTSIZES):
+        """
+        Every bwpeak for every packet size. Yields a record per point as it completes.
+        """
+        self.emit(f"Testing packets of  {' '.join(str(p) for p in pktsizes)}\n")
+        for bwpeak in bwpeaks:
+            for pktsize in pktsizes:
+                r = self.measure(bwpeak, pktsize)
+                if r is not None:
+                    yield r
+
+
+def sweep(clients, test_target, target_host=None, bwpeaks=BWPEAKS, pktsizes=PKTSIZES,
+          socktype=SOCKTYPE, log=None):
+    """
+    runbench's sweep, every bwpeak for every packet size. Yields a record per point as it
+    completes.
+    """
+    controller = Controller(clients, test_target, target_host, socktype, log)
+    yield from controller.sweep(bwpeaks, pktsizes)
@@ -0,0 +1,100 @@
+# ipbenchdata
+#   Loads ipbench latency test results into typed NumPy arrays. Handles the header variants
+#   runbench output has gone through (hyphenated, underscored, spaced, glued onto the next line,
+#   or missing entirely) and skips the noise in raw runbench logs, so cleaned files and raw logs
+#   both load. Columns are always given their canonical hyphenated names.
+# 10/2026
+
+import re
+
+import numpy as np
+
+# Canonical columns of an ipbench latency result row, in the order ipbench prints them
+COLUMNS = [
+    "Requested-throughput", "Achieved-throughput-sent", "Achieved-throughput-received",
+    "Sent-size", "Min", "Avg", "Max", "Std-dev", "Median"
+]
+FLOAT_COLUMNS = ["Std-dev"]
+
+# Names columns have gone by, normalised (see normalise)
+ALIASES = {
+    "requested-throughput" : "Requested-throughput",
+    "achieved-throughput-sent" : "Achieved-throughput-sent",
+    "achieved-throughput-received" : "Achieved-throughput-received",
+    # older 8 column header - the one achieved throughput is what the clients received
+    "achieved-throughput" : "Achieved-throughput-received",
+    "sent-size-received" : "Sent-size",
+    "sent-size" : "Sent-size",
+    "min" : "Min",
+    "minimum" : "Min",
+    "avg" : "Avg",
+    "average" : "Avg",
+    "max" : "Max",
+    "std-dev" : "Std-dev",
+    "standard-deviation" : "Std-dev",
+    "median" : "Median"
+}
+
+ROW = re.compile(r"^[0-9][0-9.,eE+\-]*$", re.MULTILINE)
+HEADER = re.compile(r"^.*[Tt]hroughput.*$", re.MULTILINE)
+
+
+def normalise(name):
+    return re.sub(r"[\s_]+", "-", name.strip()).lower()
+
+
+def parse_header(line):
+    """
+    Canonical column names from a header line. Stops at the end of the first header if the line
+    has another header (or anything else) glued on after it.
+    """
+    names = []
+    for term in line.split(","):
+        term = normalise(term)
+        name = ALIASES.get(term)
+        if name is None:
+            # e.g. "MedianRequested_throughput" - take the longest known name it starts with
+            prefixes = [a for a in ALIASES if term.startswith(a)]
+            if prefixes != []:
+                names.append(ALIASES[max(prefixes, key=len)])
+            break
+        if name in names:
+            break
+        names.append(name)
+    return names
+
+
+def loads(text):
+    """
+    Parse ipbench results from a string. Returns a dict of column name -> array, in file order.
+    Rows which don't have one value per column are skipped.
+    """
+    header = HEADER.search(text)
+    names = COLUMNS
+    if header is not None:
+        parsed = parse_header(header.group(0))
+        if len(parsed) > 1:
+            names = parsed
+
+    # Only whole result rows - drops "test started!" markers, [unmarshall] chatter etc.
+    rows = [r for r in ROW.findall(text) if r.count(",") == len(names) - 1]
+    if rows == []:
+        values = np.zeros((0, len(names)))
+    else:
+        values = np.array(",".join(rows).split(","), dtype=np.float64).reshape(len(rows), len(names))
+
+    out = {}
+    for i, name in enumerate(names):
+        if name in FLOAT_COLUMNS:
+            out[name] = values[:, i]
+        else:
+            out[name] = values[:, i].astype(np.int64)
+    return out
+
+
+def load(path):
+    """
+    Load an ipbench result file (cleaned or a raw runbench log).
+    """
+    with open(path) as f:
+        return loads(f.read())
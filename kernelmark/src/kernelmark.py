@@ -13,6 +13,8 @@ import deploy
 from finalise import finalise_iperf3
 from machine import *
 import build
+import buildfarm
+import pipeline
 from error import *
 import test
 from logfile import *
@@ -29,10 +31,17 @@ tester_pid = 0
 
 def usage():
     print("USAGE: kernelmark [system] [kernels.json] [flags]")
-    print(" FLAGS: \n   hardclean - nuke output directory\n   clean - clean output directory for this system")
+    print(" FLAGS: \n   hardclean - nuke output directory\n   clean - clean output directory for this system\n\
+   farm=N - build N kernels at once before testing\n\
+   pipeline[=N] - build up to N kernels ahead while testing")
     print(" TEST ARGS: \n   ipbench - run ipbench tests \n   iperf - run all iperf3 tests\n\
    iperf-bw - run iperf3 tests varying bw\n   iperf-pktsize - run iperf3 tests varying packet size\n\
-   bidir - run iperf in bidirectional mode (default unidirectional)\n   bibidir - run iperf in bi and unidirectional mode.")
+   bidir - run iperf in bidirectional mode (default unidirectional)\n   bibidir - run iperf in bi and unidirectional mode.\n\
+   localtransport - run load generator commands on this machine instead of over SSH\n\
+   json-stream - stream iperf3 interval results live (needs iperf3 3.17+)\n\
+   runbench - run ipbench through the runbench script instead of in process\n\
+   adaptive - search out where throughput saturates instead of sweeping fixed rates\n\
+   early-stop[=PCT] - stop iperf3 runs once throughput is known to within PCT% (default 2)")
     exit()
 
 
@@ -71,6 +80,13 @@ def main():
     skipdone = False
     buildonly = False
     local = False
+    farm_builds = 0
+    pipeline_depth = 0
+    local_transport = False
+    json_stream = False
+    use_runbench = False
+    adaptive = False
+    early_stop = None
     testflags = []
     # Collect remaining flags
     for i in range(NUM_ARGS + 1, len(sys.argv)):
@@ -82,12 +98,28 @@ def main():
             build.clean(m.name)
         elif sys.argv[i] == "buildonly":
             buildonly = True
+        elif sys.argv[i].startswith("farm="):  # Build N kernels in parallel up front
+            farm_builds = int(sys.argv[i].split("=")[1])
+        elif sys.argv[i] == "pipeline":        # Build next kernels while testing the current one
+            pipeline_depth = pipeline.DEFAULT_DEPTH
+        elif sys.argv[i].startswith("pipeline="):
+            pipeline_depth = int(sys.argv[i].split("=")[1])
         
         # Test flags
         elif sys.argv[i] == "skipdone":
             skipdone = True
         elif sys.argv[i] == "local":            # Test without trying to use distributed load.
             local = True
+        elif sys.argv[i] == "localtransport":   # Run load generator commands on this machine
+            local_transport = True
+        elif sys.argv[i] == "json-stream":      # Stream iperf3 interval results live (iperf3 3.17+)
+            json_stream = True
+        elif sys.argv[i] == "runbench":         # Run ipbench with the runbench script
+            use_runbench = True
+        elif sys.argv[i] == "adaptive":         # Adaptive rate sweeps (see saturation)
+            adaptive = True
+        elif sys.argv[i] == "early-stop" or sys.argv[i].startswith("early-stop="):  # Stop settled iperf3 runs
+            early_stop = sys.argv[i]
         elif sys.argv[i] == "ipbench":          # Run ipbench
             testflags.append("ipbench")
         elif sys.argv[i] == "iperf-pktsize":    # Run iperf varying packetsize
@@ -112,11 +144,33 @@ def main():
     # Default to unidirectional
     if "bidir" not in testflags:
         testflags.append("unidir")
+
+    if local_transport:
+        testflags.append("localtransport")
+    if json_stream:
+        testflags.append("json-stream")
+    if use_runbench:
+        testflags.append("runbench")
+    if adaptive:
+        testflags.append("adaptive")
+    if early_stop is not None:
+        testflags.append(early_stop)
     
     num_fails = 0  # consequetive build failures - if this exceeds MAX_FAILS, we stop
 
     alert(f"kernelmark started. target: {machine} kernels: {kernels_file}.")
 
+    # Build everything up front in parallel. Kernels that fail here are retried serially below.
+    if farm_builds > 0:
+        alert(f"Building kernels with {farm_builds} parallel builds.")
+        buildfarm.build_all(m, kernels, farm_builds)
+
+    # Pipelined mode - build ahead of the tester instead of taking turns with it
+    if pipeline_depth > 0 and not buildonly:
+        successful_builds, failed_builds = pipeline.run(m, kernels, local, testflags, skipdone,
+                                                        pipeline_depth, build_kernel, alert)
+        kernels = {}    # everything has been handled, skip the serial loop
+
     # Main loop
     for major in kernels:
         first_major = False  # DISABLED - Need to make clean to get new kernel headers
@@ -127,24 +181,15 @@ def main():
                     {successful_builds} successful out of {successful_builds + failed_builds} builds.")
                 exit()
 
-            status = build.build(m, kernel, first_major)
+            status = build_kernel(m, kernel, first_major)
 
             if status == ERR_OK:
-                alert(f"Kernel version {kernel} built successfully.")
                 successful_builds += 1
                 num_fails = 0
             else:
-                sub_status = ERR_OK
-                if not first_major:
-                    alert(
-                        f"Kernel version {kernel} failed to build. Retrying with make clean.")
-                    sub_status = build.build(m, kernel, True)
-                if sub_status != ERR_OK:
-                    alert(
-                        f"Kernel version {kernel} failed to build. Continuing")
-                    num_fails += 1
-                    failed_builds += 1
-                    continue
+                num_fails += 1
+                failed_builds += 1
+                continue
 
             first_major = False
 
@@ -174,6 +219,22 @@ def main():
         f"Kernel testing complete! {successful_builds} successful out of {successful_builds + failed_builds} builds.")
 
 
+def build_kernel(m, kernel, clean):
+    """
+    Build a kernel, retrying once with make clean if the first attempt fails.
+    """
+    status = build.build(m, kernel, clean)
+    if status != ERR_OK and not clean:
+        alert(f"Kernel version {kernel} failed to build. Retrying with make clean.")
+        status = build.build(m, kernel, True)
+
+    if status == ERR_OK:
+        alert(f"Kernel version {kernel} built successfully.")
+    else:
+        alert(f"Kernel version {kernel} failed to build. Continuing")
+    return status
+
+
 def alert(s):
     print("\033[91m {}\033[00m" .format(s))
     Logfile.log(f"ALERT: {s}\n")
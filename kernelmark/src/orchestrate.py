@@ -0,0 +1,122 @@
+# orchestrate
+#   asyncio orchestration of multi-client iperf3 tests. All load generators are launched
+#   together and start iperf3 at the same wall clock time, every one of them is awaited, and
+#   their results are streamed back in parallel (see collector). Clients whose actual start time is skewed from the
+#   others are flagged since they distort the aggregate throughput.
+#   Start times are measured on the load generators, so their clocks need to be NTP synced.
+# 10/2026
+
+import asyncio
+import json
+import statistics
+import time
+
+from collector import ResultCollector
+
+START_LEAD = 3.0        # seconds between launching clients and the synchronised start
+SKEW_LIMIT = 0.5        # seconds a client may start away from the median before it is flagged
+START_TAG = "KM_START"
+
+
+def remote_command(iperf_args, start_at):
+    """
+    Shell command for a load generator: sleep until start_at, report the actual start time, run iperf3.
+    """
+    return (f"now=$(date +%s.%N); sleep $(awk \"BEGIN {{ d = {start_at:.3f} - $now; print (d > 0) ? d : 0 }}\"); "
+            f"echo {START_TAG} $(date +%s.%N); iperf3 {iperf_args}")
+
+
+async def run_client(transport, host, iperf_args, start_at, collector):
+    """
+    Run one load generator, streaming its results into collector (which is left to the caller
+    to finish). Returns (host, actual start time or None, exit code).
+    """
+    proc = await transport.start_async(host, remote_command(iperf_args, start_at),
+                                       stdout=asyncio.subprocess.PIPE)
+    started = None
+    async for line in proc.stdout:
+        fields = line.decode(errors="replace").split()
+        if started is None and len(fields) == 2 and fields[0] == START_TAG:
+            try:
+                started = float(fields[1])
+                continue
+            except ValueError:
+                pass
+        collector.feed(line)
+    code = await proc.wait()
+    return host, started, code
+
+
+def stragglers(starts):
+    """
+    Given host -> start time, return host -> skew (seconds from the median) for clients that
+    started too far from the others, or didn't report starting at all.
+    """
+    known = [t for t in starts.values() if t is not None]
+    if known == []:
+        return {host: None for host in starts}
+    median = statistics.median(known)
+    out = {}
+    for host, t in starts.items():
+        if t is None:
+            out[host] = None
+        elif abs(t - median) > SKEW_LIMIT:
+            out[host] = t - median
+    return out
+
+
+async def run_multi(transport, clients, json_stream, skew_file, monitor=None, between=None):
+    """
+    clients is a list of (host, iperf3 arguments, local result path). Runs all of them over
+    transport (see sshpool) with a synchronised start, collects their results as they stream
+    in and writes start skews to skew_file. json_stream says whether iperf3 is run with
+    --json-stream. If given a Monitor (see earlystop) with a source per client, the arguments
+    are for one segment of the test, and all clients run segments together until their total
+    throughput has settled, awaiting between() (if given) before each further segment.
+    Returns the hosts flagged as stragglers.
+    """
+    collectors = [ResultCollector(path, json_stream, host.split(".")[0], monitor, i)
+                  for i, (host, _, path) in enumerate(clients)]
+    segments = []
+    late = {}
+    while True:
+        start_at = time.time() + START_LEAD
+        runs = await asyncio.gather(*[run_client(transport, host, args, start_at, c)
+                                      for (host, args, _), c in zip(clients, collectors)])
+
+        for host, _, code in runs:
+            if code != 0:
+                print(f"WARNING: iperf3 on {host} exited with {code}")
+
+        starts = {host: started for host, started, _ in runs}
+        segment_late = stragglers(starts)
+        for host, skew in segment_late.items():
+            if skew is None:
+                print(f"WARNING: {host} did not report its start time")
+            else:
+                print(f"WARNING: {host} started {skew:+.3f}s from the other clients")
+        late.update(segment_late)
+        segments.append({
+            "start_at" : start_at,
+            "starts" : starts,
+            "stragglers" : segment_late
+        })
+
+        # every collector closes off its segment, whether or not there's another
+        more = [c.next_segment() for c in collectors]
+        if any(code != 0 for _, _, code in runs) or not all(more):
+            break
+        if between is not None:
+            await between()
+
+    for (host, _, _), c in zip(clients, collectors):
+        if not c.finish():
+            print(f"WARNING: no results from {host}")
+
+    with open(skew_file, "w") as f:
+        skews = dict(segments[0])
+        if len(segments) > 1:
+            skews["stragglers"] = late
+            skews["segments"] = segments
+        json.dump(skews, f, indent=4)
+    return list(late)
@@ -0,0 +1,105 @@
+# pipeline
+#   Pipelined build/test for kernelmark. A producer process builds kernels ahead into a bounded
+#   queue while the main process deploys and tests whichever build is ready, so the build host
+#   and the target are busy at the same time. Builds run in a process of their own, as testers
+#   are forked and must not inherit a build half way through.
+# 10/2026
+
+import multiprocessing
+import os
+from queue import Full
+from signal import SIGKILL
+
+import build
+import deploy
+import test
+from error import *
+
+DEFAULT_DEPTH = 2   # number of finished builds allowed to wait for the tester
+MAX_FAILS = 8       # maximum number of consecutive build failures
+
+
+def run(machine, kernels, local, testflags, skipdone, depth, build_fn, alert):
+    """
+    Build and test all kernels with builds running ahead of tests by up to depth kernels.
+    build_fn(machine, kernel, clean) must build a kernel and return an error code. It and alert
+    are called in the producer process, so must be module level functions.
+    Returns (successful builds, failed builds).
+    """
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Queue(maxsize=depth)
+    stop = ctx.Event()
+    stats = {"ok": ctx.Value("i", 0), "failed": ctx.Value("i", 0)}
+
+    # Daemonic, so that exiting on an error doesn't wait for the build in progress
+    producer = ctx.Process(target=produce, args=(machine, kernels, ready, stop, stats, build_fn, alert),
+                           daemon=True)
+    producer.start()
+    try:
+        consume(machine, ready, local, testflags, skipdone, alert)
+    except BaseException:
+        stop.set()
+        raise
+    stop.set()
+    producer.join()
+    return stats["ok"].value, stats["failed"].value
+
+
+def produce(machine, kernels, ready, stop, stats, build_fn, alert):
+    """
+    Build kernels in order and hand successful builds to the consumer. Puts None when done.
+    """
+    num_fails = 0
+    for major in kernels:
+        for kernel in kernels[major]:
+            if stop.is_set():
+                return
+            if num_fails >= MAX_FAILS:
+                alert(f"Too many consecutive build failures! Last unsuccessful build was v {kernel}.")
+                put(ready, None, stop)
+                return
+
+            alert(f"\033[01m ### BUILDING: kernel {kernel} ###\033[00m")
+            if build_fn(machine, kernel, False) != ERR_OK:
+                num_fails += 1
+                stats["failed"].value += 1
+                continue
+
+            num_fails = 0
+            stats["ok"].value += 1
+            put(ready, kernel, stop)
+    put(ready, None, stop)
+
+
+def consume(machine, ready, local, testflags, skipdone, alert):
+    """
+    Deploy and test builds as they become ready. A failed deployment is fatal.
+    """
+    while True:
+        kernel = ready.get()
+        if kernel is None:
+            return
+
+        alert(f"\033[01m ### STARTING TEST: kernel {kernel} ###\033[00m")
+        if skipdone and build.kernel_built(machine, kernel) and test.tests_exist(machine, kernel):
+            alert(f"Skipping test on kernel {kernel} because it is already built and a test has run.")
+            continue
+
+        tester_pid = test.test(machine, kernel, local, testflags)
+        status = deploy.deploy(machine, kernel)
+        if status:
+            print_err(status)
+            os.kill(tester_pid, SIGKILL)
+            exit()
+
+
+def put(ready, item, stop):
+    """
+    Put into the queue without blocking forever if the consumer has gone away.
+    """
+    while not stop.is_set():
+        try:
+            ready.put(item, timeout=1)
+            return
+        except Full:
+            continue
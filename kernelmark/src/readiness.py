@@ -0,0 +1,329 @@
+# readiness
+#   Event driven detection of the target finishing boot. Probes the target's testerwait on UDP
+#   port 1345 at a short, backing off interval, also accepts the "ready" datagram testerwait
+#   announces on its own, then checks the iperf3 servers are actually accepting connections.
+#   When several targets are tested at once, one process listens on the port for all of them
+#   (see BootRelay). Also sequences tests by waiting on server/result readiness instead of
+#   fixed sleeps.
+# 10/2026
+
+import asyncio
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+BOOT_PORT = 1345
+BOOT_TIMEOUT = 600      # seconds until we give up on the target
+PROBE_MIN = 0.25        # first probe interval (seconds)
+PROBE_MAX = 5.0         # probe interval backs off up to this
+PROBE_BACKOFF = 1.5
+IPERF_PORTS = [5000, 5001, 5002, 5003]
+READY_MSG = b"Emu"
+RELAY_ENV = "KERNELMARK_BOOT_RELAY"    # socket of the BootRelay testers should wait through
+
+
+class BootListener(asyncio.DatagramProtocol):
+    """
+    Listens for testerwait on the targets, either answering a probe or announcing itself. waiting
+    maps the IP of each target being waited for to the event to set once it's up.
+    """
+    def __init__(self, waiting):
+        self.waiting = waiting
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        ip = addr[0]
+        if ip not in self.waiting:
+            return
+        if data != READY_MSG:
+            print(f"Incorrect packet returned! {data}")
+            return
+        # Answer so testerwait gets its probe even if it announced itself first. Announcements come
+        # from another port, so always answer testerwait's listening port.
+        self.transport.sendto(READY_MSG, (ip, BOOT_PORT))
+        if not self.waiting[ip].is_set():
+            print(f"Server {ip} found")
+            self.waiting[ip].set()
+
+    def error_received(self, exc):
+        # ICMP unreachable while the target is still booting
+        pass
+
+
+async def probe(transport, ip, ready, timeout):
+    """
+    Probe testerwait on ip from the BOOT_PORT endpoint transport until ready is set (see
+    BootListener). Returns False on timeout.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = PROBE_MIN
+    while not ready.is_set():
+        if loop.time() > deadline:
+            return False
+        transport.sendto(READY_MSG, (ip, BOOT_PORT))
+        try:
+            await asyncio.wait_for(ready.wait(), interval)
+        except asyncio.TimeoutError:
+            interval = min(interval * PROBE_BACKOFF, PROBE_MAX)
+    return True
+
+
+async def wait_boot(ip, timeout):
+    """
+    Wait until testerwait on the target responds. Returns False on timeout. Only one process
+    can listen on BOOT_PORT, so if a BootRelay is running this waits through it instead.
+    """
+    if os.environ.get(RELAY_ENV) is not None:
+        return await wait_boot_relayed(os.environ[RELAY_ENV], ip, timeout)
+
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    transport, _ = await loop.create_datagram_endpoint(lambda: BootListener({ip: ready}),
+                                                       local_addr=(str(socket.INADDR_ANY), BOOT_PORT))
+    try:
+        return await probe(transport, ip, ready, timeout)
+    finally:
+        transport.close()
+
+
+async def wait_boot_relayed(path, ip, timeout):
+    """
+    Ask the BootRelay listening on unix socket path to wait for ip.
+    """
+    try:
+        reader, writer = await asyncio.open_unix_connection(path)
+    except OSError as e:
+        print(f"Can't reach the boot relay: {e}")
+        return False
+    try:
+        writer.write(f"{ip} {timeout}\n".encode())
+        await writer.drain()
+        return await reader.readline() == b"ok\n"
+    finally:
+        writer.close()
+
+
+class BootRelay():
+    """
+    Listens on BOOT_PORT for every target being tested from this machine, so several testers
+    (in other processes) can wait for their targets at once. Runs its own event loop in a thread,
+    taking requests from testers on a unix socket: a target's IP and a timeout, answered with ok
+    once it is up or timeout. Testers find it through RELAY_ENV, which start() sets.
+    """
+    def __init__(self):
+        self.dir = tempfile.mkdtemp(prefix="kernelmark-boot-")
+        self.path = f"{self.dir}/relay"
+        self.waiting = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.transport = None
+        self.server = None
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.listen(), self.loop).result()
+        os.environ[RELAY_ENV] = self.path
+
+    async def listen(self):
+        self.transport, _ = await self.loop.create_datagram_endpoint(lambda: BootListener(self.waiting),
+                                                                     local_addr=(str(socket.INADDR_ANY), BOOT_PORT))
+        self.server = await asyncio.start_unix_server(self.handle, self.path)
+
+    async def handle(self, reader, writer):
+        try:
+            ip, timeout = (await reader.readline()).decode().split()
+            if ip in self.waiting:
+                print(f"Already waiting for {ip}")
+                writer.write(b"busy\n")
+                return
+            self.waiting[ip] = asyncio.Event()
+            try:
+                ok = await probe(self.transport, ip, self.waiting[ip], float(timeout))
+            finally:
+                del self.waiting[ip]
+            writer.write(b"ok\n" if ok else b"timeout\n")
+            await writer.drain()
+        except (ValueError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        async def shutdown():
+            self.server.close()
+            self.transport.close()
+        if self.server is not None:
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        os.environ.pop(RELAY_ENV, None)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+async def wait_port(ip, port, timeout):
+    """
+    Wait until something is listening on ip:port. Returns False on timeout.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = PROBE_MIN
+    while loop.time() < deadline:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), PROBE_MAX)
+            writer.close()
+            await writer.wait_closed()
+            return True
+        except (OSError, asyncio.TimeoutError):
+            await asyncio.sleep(interval)
+            interval = min(interval * PROBE_BACKOFF, PROBE_MAX)
+    return False
+
+
+async def wait_ready(ip, ports, timeout):
+    """
+    Wait for boot, then for every port to accept connections.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    if not await wait_boot(ip, timeout):
+        return False
+    print("Server ready! Waiting for iperf3 servers...")
+    remaining = max(deadline - loop.time(), PROBE_MIN)
+    results = await asyncio.gather(*[wait_port(ip, p, remaining) for p in ports])
+    for port, ok in zip(ports, results):
+        if not ok:
+            print(f"Nothing listening on port {port}")
+    return all(results)
+
+
+def wait_for_target(machine, ports=IPERF_PORTS, timeout=BOOT_TIMEOUT):
+    """
+    Block until the target is booted and its iperf3 servers are listening.
+    """
+    return asyncio.run(wait_ready(machine.ip, ports, timeout))
+
+
+# Sequencing between tests. Instead of sleeping a fixed time around each test, wait for the
+# conditions the sleeps were standing in for: the iperf3 server accepting a new test, the previous
+# client having exited, and its result file being complete.
+
+IDLE_PROBE = 0.2        # how long a server has to stay quiet after accept to count as idle
+TEST_TIMEOUT = 60       # seconds to wait for a server or result before giving up
+ACCESS_DENIED = b"\xff" # iperf3 sends this to new clients while a test is running
+
+
+async def wait_server_idle(ip, port, timeout):
+    """
+    Wait until the iperf3 server on ip:port will accept a new test. A busy iperf3 server rejects
+    new control connections straight away (with ACCESS_DENIED), an idle one waits for the client's
+    cookie. Each probe of an idle server takes up its one test slot for up to IDLE_PROBE and
+    hangs up without a cookie, which the server logs as a failed test, so only probe ports
+    nothing else is about to test on (i.e. leased ones, see generators) before starting a client.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = PROBE_MIN
+    while loop.time() < deadline:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), PROBE_MAX)
+        except (OSError, asyncio.TimeoutError):
+            await asyncio.sleep(interval)
+            interval = min(interval * PROBE_BACKOFF, PROBE_MAX)
+            continue
+        try:
+            data = await asyncio.wait_for(reader.read(1), IDLE_PROBE)
+        except asyncio.TimeoutError:
+            data = None
+        except OSError:
+            data = b""
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        if data is None:
+            return True
+        if data != ACCESS_DENIED and data != b"":
+            print(f"Unexpected reply from iperf3 server on {ip}:{port}: {data}")
+        await asyncio.sleep(interval)
+        interval = min(interval * PROBE_BACKOFF, PROBE_MAX)
+    return False
+
+
+async def wait_servers_idle(ip, ports, timeout=TEST_TIMEOUT):
+    results = await asyncio.gather(*[wait_server_idle(ip, p, timeout) for p in ports])
+    return all(results)
+
+
+def result_complete(path):
+    """
+    True if path holds a complete iperf3 JSON result.
+    """
+    try:
+        with open(path) as f:
+            json.load(f)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+async def wait_results(paths, timeout=TEST_TIMEOUT):
+    """
+    Wait until every result file has been completely written.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = PROBE_MIN / 5
+    while loop.time() < deadline:
+        if all(result_complete(p) for p in paths):
+            return True
+        await asyncio.sleep(interval)
+        interval = min(interval * PROBE_BACKOFF, PROBE_MAX)
+    return False
+
+
+class Sequencer():
+    """
+    Waits on real conditions between tests and keeps track of how much time that saved over the
+    fixed sleeps it replaces.
+    """
+    def __init__(self):
+        self.saved = 0.0
+        self.waited = 0.0
+        self.tests = 0
+
+    def before(self, ip, ports, fixed_sleep):
+        """
+        Wait until the servers on ports are ready for a new test.
+        """
+        start = time.monotonic()
+        if not asyncio.run(wait_servers_idle(ip, ports)):
+            print(f"WARNING: iperf3 servers on {ip} {ports} still not idle. Continuing anyway.")
+        self.account(start, fixed_sleep)
+        self.tests += 1
+
+    def after(self, paths, fixed_sleep):
+        """
+        Wait until the results of a finished test are complete.
+        """
+        start = time.monotonic()
+        if not asyncio.run(wait_results(paths)):
+            print(f"WARNING: incomplete results {paths}")
+        self.account(start, fixed_sleep)
+
+    def account(self, start, fixed_sleep):
+        waited = time.monotonic() - start
+        self.waited += waited
+        self.saved += fixed_sleep - waited
+
+    def report(self):
+        print(f"Sequencing: {self.tests} tests, {self.waited:.1f}s spent waiting, "
+              f"{self.saved:.1f}s saved over fixed sleeps.")
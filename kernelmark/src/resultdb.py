@@ -0,0 +1,440 @@
+# resultdb
+#   Indexed store of test results. Metrics are extracted from each iperf3 result file once and
+#   kept in an SQLite database in the output dir, keyed by machine/kernel/protocol/mode/bw/
+#   packet size/thread. Graphing queries the database instead of reparsing every result file.
+#   Ingest is incremental: every result file (iperf3 and ipbench) is tracked by size, mtime and
+#   content hash, only new or changed files are parsed, and the changes are reported so only
+#   the affected plots need to be redrawn. Files are checked and parsed in parallel, one kernel
+#   directory per worker process. ipbench results (cleaned or raw runbench logs, see runlog) are
+#   stored one row per test point. Each iperf3 result's duration is kept, along with the
+#   precision of runs which could stop early (see earlystop).
+# 10/2026
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import runlog
+
+DB_NAME = "results.db"
+SCHEMA_VERSION = 4
+IPBENCH_RESULT = "ipbench_result"
+CHUNK_SZ = 1 << 20
+
+# Where the sections of an iperf3 result we need start. Only the end object is ever decoded.
+INTERVALS_KEY = re.compile(rb'"intervals"\s*:\s*\[')
+END_KEY = re.compile(rb'"end"\s*:\s*\{')
+INTERVAL_MARKER = b'"streams"'
+# Added after the end object by the collector for early stopping runs (see earlystop)
+KERNELMARK_KEY = re.compile(rb'"kernelmark"\s*:\s*\{')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    machine TEXT NOT NULL,
+    kernel TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    ok INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS iperf (
+    path TEXT PRIMARY KEY REFERENCES files(path) ON DELETE CASCADE,
+    machine TEXT NOT NULL,
+    kernel TEXT NOT NULL,
+    protocol TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    bidir INTEGER NOT NULL,
+    thread INTEGER NOT NULL,
+    bw INTEGER NOT NULL,
+    pktsize INTEGER NOT NULL,
+    throughput_send REAL NOT NULL,
+    throughput_receive REAL NOT NULL,
+    cpu REAL NOT NULL,
+    rtt REAL NOT NULL,
+    duration REAL,
+    precision REAL
+);
+CREATE INDEX IF NOT EXISTS iperf_key
+    ON iperf (machine, kernel, protocol, mode, bw, pktsize, thread);
+CREATE TABLE IF NOT EXISTS ipbench (
+    path TEXT NOT NULL,
+    machine TEXT NOT NULL,
+    kernel TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    bps INTEGER,
+    pktsize INTEGER,
+    clients INTEGER,
+    requested_throughput INTEGER,
+    achieved_throughput_sent INTEGER,
+    achieved_throughput_received INTEGER,
+    sent_size INTEGER,
+    min INTEGER,
+    avg INTEGER,
+    max INTEGER,
+    std_dev REAL,
+    median INTEGER,
+    PRIMARY KEY (path, seq)
+);
+CREATE INDEX IF NOT EXISTS ipbench_key
+    ON ipbench (machine, kernel, pktsize, bps, clients);
+"""
+
+IPERF_COLUMNS = [
+    "kernel", "protocol", "mode", "bidir", "thread", "bw", "pktsize",
+    "throughput_send", "throughput_receive", "cpu", "rtt", "duration", "precision"
+]
+
+# ipbench record field (see runlog) -> column
+IPBENCH_COLUMNS = {
+    "bps" : "bps",
+    "pktsize" : "pktsize",
+    "clients" : "clients",
+    "Requested-throughput" : "requested_throughput",
+    "Achieved-throughput-sent" : "achieved_throughput_sent",
+    "Achieved-throughput-received" : "achieved_throughput_received",
+    "Sent-size" : "sent_size",
+    "Min" : "min",
+    "Avg" : "avg",
+    "Max" : "max",
+    "Std-dev" : "std_dev",
+    "Median" : "median"
+}
+
+
+def connect(out_dir):
+    """
+    Open the result database in out_dir, creating it if needed. A database with an older schema
+    is discarded - it only holds data derived from the result files.
+    """
+    # several processes may be writing (see runlog), so wait for each other's transactions
+    db = sqlite3.connect(f"{out_dir}/{DB_NAME}", timeout=60)
+    db.execute("PRAGMA foreign_keys = ON")
+    if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+        db.executescript("DROP TABLE IF EXISTS iperf; DROP TABLE IF EXISTS ipbench; DROP TABLE IF EXISTS files;")
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    db.executescript(SCHEMA)
+    return db
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SZ)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def is_iperf_result(name):
+    return name.startswith("iperf3") and name.endswith(".test")
+
+
+def parse_name(name):
+    """
+    Get the test parameters from a result filename, e.g. iperf3-mt2-tcp.bidir-100m-1448.test
+    Returns None for names that don't fit.
+    """
+    fields = name[:-len(".test")].split("-")
+    if len(fields) != 5 or fields[0] != "iperf3":
+        return None
+    mode = fields[1]
+    thread = 0
+    if mode.startswith("mt"):
+        try:
+            thread = int(mode[2:])
+        except ValueError:
+            return None
+        mode = "mt"
+    elif mode != "st":
+        # local tests aren't indexed
+        return None
+    try:
+        bw = int(fields[3].split("m")[0])
+        pktsize = int(fields[4])
+    except ValueError:
+        return None
+    return {
+        "protocol" : fields[2].split(".")[0],
+        "mode" : mode,
+        "bidir" : "bidir" in fields[2],
+        "thread" : thread,
+        "bw" : bw,
+        "pktsize" : pktsize
+    }
+
+
+def summary(path):
+    """
+    Read just the end object and the number of intervals from an iperf3 result, without parsing
+    the (much larger) intervals array. The file is mapped rather than read in.
+    Falls back to parsing the whole file if it isn't laid out as expected.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        intervals = INTERVALS_KEY.search(m)
+        # Only the top level end is an object - the ones in intervals and streams are times
+        end = None
+        for end in END_KEY.finditer(m, intervals.end() if intervals else 0):
+            pass
+        if intervals is not None and end is not None:
+            # Each interval has exactly one streams list
+            count = 0
+            pos = m.find(INTERVAL_MARKER, intervals.end(), end.start())
+            while pos != -1:
+                count += 1
+                pos = m.find(INTERVAL_MARKER, pos + len(INTERVAL_MARKER), end.start())
+            try:
+                obj, _ = json.JSONDecoder().raw_decode(m[end.end() - 1:].decode())
+                return obj, count
+            except ValueError:
+                pass
+
+    with open(path) as f:
+        result = json.load(f)
+    return result["end"], len(result["intervals"])
+
+
+def annotation(path):
+    """
+    The kernelmark object the collector added to an iperf3 result (see earlystop), or None.
+    It comes last, so is looked for from the end of the file.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        pos = m.rfind(b'"kernelmark"')
+        key = KERNELMARK_KEY.match(m, pos) if pos != -1 else None
+        if key is None:
+            return None
+        try:
+            obj, _ = json.JSONDecoder().raw_decode(m[key.end() - 1:].decode())
+        except ValueError:
+            return None
+    return obj
+
+
+def extract(path, params):
+    """
+    Pull the metrics used for graphing out of an iperf3 result. Returns None if the test didn't run.
+    """
+    end, num_intervals = summary(path)
+    if num_intervals == 0:
+        return None
+
+    throughput_receive = 0.0
+    throughput_send = float(end["sum_sent"]["bits_per_second"] / (10**6))
+    if params["bidir"]:
+        throughput_receive = float(end["sum_sent_bidir_reverse"]["bits_per_second"] / (10**6))
+
+    if params["protocol"] == "tcp":
+        rtt = end["streams"][0]["sender"]["mean_rtt"]
+    else:
+        rtt = float(end["sum"]["jitter_ms"]) * 2000.0
+
+    # Runs which could stop early record how precise they got
+    precision = None
+    meta = annotation(path)
+    if meta is not None:
+        precision = meta.get("precision")
+
+    return {
+        "throughput_send" : throughput_send,
+        "throughput_receive" : throughput_receive,
+        "cpu" : end["cpu_utilization_percent"]["host_total"],
+        "rtt" : rtt,
+        "duration" : end["sum_sent"].get("seconds"),
+        "precision" : precision
+    }
+
+
+def scan(out_dir, machine_name, kernel):
+    """
+    Find the result files for a kernel. Yields (kind, filename), kind being iperf3 or ipbench.
+    """
+    for name in sorted(os.listdir(f"{out_dir}/{machine_name}/{kernel}")):
+        if name == IPBENCH_RESULT:
+            yield "ipbench", name
+        elif is_iperf_result(name) and parse_name(name) is not None:
+            yield "iperf3", name
+
+
+def describe(kind, kernel, name):
+    """
+    What a result file is a result for, as reported by ingest.
+    """
+    change = {"kind" : kind, "kernel" : kernel}
+    if kind == "iperf3":
+        change.update(parse_name(name))
+    return change
+
+
+def check_kernel(out_dir, machine_name, kernel, known):
+    """
+    Check the result files for one kernel against known (path -> (size, mtime, hash)), parsing
+    those which are new or changed. Runs in an ingest worker, so doesn't touch the database.
+    Returns (paths seen, updates) where each update is a dict describing a file to (re)index.
+    """
+    seen = []
+    updates = []
+    for kind, name in scan(out_dir, machine_name, kernel):
+        path = f"{machine_name}/{kernel}/{name}"
+        seen.append(path)
+        try:
+            st = os.stat(f"{out_dir}/{path}")
+            if path in known and known[path][:2] == (st.st_size, st.st_mtime_ns):
+                continue
+            h = file_hash(f"{out_dir}/{path}")
+        except OSError:
+            continue
+
+        update = {
+            "kind" : kind,
+            "name" : name,
+            "path" : path,
+            "size" : st.st_size,
+            "mtime" : st.st_mtime_ns,
+            "hash" : h,
+            "changed" : path not in known or known[path][2] != h,
+            "metrics" : None
+        }
+        if update["changed"] and kind == "iperf3":
+            update["metrics"] = extract_iperf(out_dir, machine_name, kernel, name, path)
+        elif update["changed"] and kind == "ipbench":
+            with open(f"{out_dir}/{path}") as f:
+                update["metrics"] = list(runlog.records(f))
+        updates.append(update)
+    return seen, updates
+
+
+def extract_iperf(out_dir, machine_name, kernel, name, path):
+    """
+    Metrics for an iperf3 result, or None if the test didn't run or can't be read.
+    """
+    try:
+        metrics = extract(f"{out_dir}/{path}", parse_name(name))
+    except (OSError, ValueError, KeyError, IndexError, TypeError):
+        print(f"Failed to open {machine_name} - {kernel} {name}")
+        return None
+    if metrics is None:
+        print(f"Test {machine_name} - {kernel} {name} failed to run. Skipping.")
+    return metrics
+
+
+def ingest(db, out_dir, machine_name, workers=None):
+    """
+    Bring the index up to date with the result files for a machine. A file is only parsed if
+    it is new or its contents have changed; entries for files which no longer exist are dropped.
+    Kernel directories are checked in parallel by workers processes (default: one per core), and
+    the results are applied in sorted order so the index is the same for any number of workers.
+    Returns a list of changes (see describe), one per file added, changed or removed.
+    """
+    known = {}
+    for path, size, mtime, h in db.execute("SELECT path, size, mtime, hash FROM files WHERE machine = ?",
+                                           (machine_name,)):
+        known[path] = (size, mtime, h)
+
+    kernels = sorted(k for k in os.listdir(f"{out_dir}/{machine_name}")
+                     if os.path.isdir(f"{out_dir}/{machine_name}/{k}"))
+    jobs = []
+    for kernel in kernels:
+        prefix = f"{machine_name}/{kernel}/"
+        jobs.append((out_dir, machine_name, kernel,
+                     {p: known[p] for p in known if p.startswith(prefix)}))
+
+    if workers is None:
+        workers = os.cpu_count()
+    if workers <= 1 or len(jobs) <= 1:
+        results = [check_kernel(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+            results = list(pool.map(check_kernel, *zip(*jobs)))
+
+    seen = set()
+    changes = []
+    for kernel, (kernel_seen, updates) in zip(kernels, results):
+        seen.update(kernel_seen)
+        for u in updates:
+            if not u["changed"]:
+                # touched but not changed
+                db.execute("UPDATE files SET size = ?, mtime = ? WHERE path = ?", (u["size"], u["mtime"], u["path"]))
+                continue
+
+            # replacing the file entry drops anything extracted from the old version
+            ok = u["metrics"] is not None and u["metrics"] != []
+            db.execute("DELETE FROM files WHERE path = ?", (u["path"],))
+            db.execute("DELETE FROM ipbench WHERE path = ?", (u["path"],))
+            db.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (u["path"], machine_name, kernel, u["kind"], u["size"], u["mtime"], u["hash"], ok))
+            if u["kind"] == "iperf3" and ok:
+                params = parse_name(u["name"])
+                params.update(u["metrics"])
+                params["kernel"] = kernel
+                db.execute(f"INSERT INTO iperf VALUES (?, ?, {', '.join('?' * len(IPERF_COLUMNS))})",
+                           [u["path"], machine_name] + [params[c] for c in IPERF_COLUMNS])
+            elif u["kind"] == "ipbench" and ok:
+                add_ipbench(db, u["path"], machine_name, kernel, u["metrics"])
+            changes.append(describe(u["kind"], kernel, u["name"]))
+
+    gone = sorted(set(known) - seen)
+    for path in gone:
+        db.execute("DELETE FROM files WHERE path = ?", (path,))
+        db.execute("DELETE FROM ipbench WHERE path = ?", (path,))
+        _, kernel, name = path.split("/")
+        changes.append(describe("ipbench" if name == IPBENCH_RESULT else "iperf3", kernel, name))
+    db.commit()
+    print(f"Indexed {len(changes) - len(gone)} new or changed results for {machine_name} ({len(gone)} removed)")
+    return changes
+
+
+def add_ipbench(db, path, machine_name, kernel, records, seq=0):
+    """
+    Store ipbench records (see runlog) read from path, numbering them from seq.
+    """
+    db.executemany(f"INSERT OR REPLACE INTO ipbench (path, machine, kernel, seq, {', '.join(IPBENCH_COLUMNS.values())}) "
+                   f"VALUES (?, ?, ?, ?, {', '.join('?' * len(IPBENCH_COLUMNS))})",
+                   [[path, machine_name, kernel, seq + i] + [r.get(field) for field in IPBENCH_COLUMNS]
+                    for i, r in enumerate(records)])
+
+
+def ipbench_tests(db, machine_name, **where):
+    """
+    Query ipbench results for a machine, optionally filtered on columns, e.g. pktsize=1472.
+    Returns a list of dicts keyed by record field (see runlog), plus kernel.
+    """
+    fields = ["kernel"] + list(IPBENCH_COLUMNS)
+    columns = ["kernel"] + list(IPBENCH_COLUMNS.values())
+    sql = f"SELECT {', '.join(columns)} FROM ipbench WHERE machine = ?"
+    args = [machine_name]
+    for column in where:
+        if column not in columns:
+            raise ValueError(f"Unknown column {column}")
+        sql += f" AND {column} = ?"
+        args.append(where[column])
+    sql += " ORDER BY kernel, path, seq"
+    return [dict(zip(fields, row)) for row in db.execute(sql, args)]
+
+
+def kernels(db, machine_name):
+    return [k for (k,) in db.execute("SELECT DISTINCT kernel FROM files WHERE machine = ? ORDER BY kernel",
+                                     (machine_name,))]
+
+
+def iperf_tests(db, machine_name, **where):
+    """
+    Query iperf3 results for a machine, optionally filtered on columns, e.g. protocol="udp".
+    Returns a list of dicts with IPERF_COLUMNS as keys.
+    """
+    sql = f"SELECT {', '.join(IPERF_COLUMNS)} FROM iperf WHERE machine = ?"
+    args = [machine_name]
+    for column in where:
+        if column not in IPERF_COLUMNS:
+            raise ValueError(f"Unknown column {column}")
+        sql += f" AND {column} = ?"
+        args.append(where[column])
+    sql += " ORDER BY kernel, path"
+    return [dict(zip(IPERF_COLUMNS, row)) for row in db.execute(sql, args)]
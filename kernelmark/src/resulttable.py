@@ -0,0 +1,179 @@
+# resulttable
+#   Columnar table of iperf3 results backed by NumPy arrays, one typed array per column.
+#   Selecting, sorting and grouping are vectorised, so graphing can slice out the tests it needs
+#   without scanning and re-sorting nested dicts of tests.
+# 10/2026
+
+import numpy as np
+
+import resultdb
+
+COLUMN_TYPES = {
+    "kernel" : np.str_,
+    "protocol" : np.str_,
+    "mode" : np.str_,
+    "bidir" : np.bool_,
+    "thread" : np.int32,
+    "bw" : np.int32,
+    "pktsize" : np.int32,
+    "throughput_send" : np.float64,
+    "throughput_receive" : np.float64,
+    "cpu" : np.float64,
+    "rtt" : np.float64,
+    "duration" : np.float64,    # NaN if unknown
+    "precision" : np.float64    # NaN unless the run could stop early (see earlystop)
+}
+
+
+class ResultTable():
+    def __init__(self, columns):
+        """
+        columns maps each column name in COLUMN_TYPES to a sequence of values, all the same length.
+        """
+        self.columns = {}
+        for name in COLUMN_TYPES:
+            self.columns[name] = np.asarray(columns[name], dtype=COLUMN_TYPES[name])
+
+    def __len__(self):
+        return len(self.columns["kernel"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def take(self, index):
+        """
+        New table of the rows picked out by index (a boolean mask or array of row numbers).
+        """
+        return ResultTable({name: col[index] for name, col in self.columns.items()})
+
+    def mask(self, **where):
+        out = np.ones(len(self), dtype=np.bool_)
+        for name, value in where.items():
+            out &= self.columns[name] == value
+        return out
+
+    def select(self, **where):
+        """
+        Rows where each given column equals the given value, e.g. select(protocol="tcp", bidir=False)
+        """
+        return self.take(self.mask(**where))
+
+    def sort(self, *keys):
+        """
+        Rows sorted by keys, first key most significant. The sort is stable.
+        """
+        if len(self) == 0:
+            return self
+        return self.take(np.lexsort([self.columns[k] for k in reversed(keys)]))
+
+    def unique(self, name):
+        """
+        Distinct values of a column, in order of first appearance.
+        """
+        values, first = np.unique(self.columns[name], return_index=True)
+        return values[np.argsort(first)]
+
+    def counts(self, name):
+        """
+        (distinct values of a column in order of first appearance, number of rows with each)
+        """
+        values, first, counts = np.unique(self.columns[name], return_index=True, return_counts=True)
+        order = np.argsort(first)
+        return values[order], counts[order]
+
+    def group(self, keys, column, how="mean"):
+        """
+        Aggregate column over the rows sharing values of keys. how is one of sum, mean, min, max
+        or count. Returns (key name -> array of key values for each group, array of aggregates),
+        with groups sorted by key.
+        """
+        if len(self) == 0:
+            return {k: self.columns[k][:0] for k in keys}, np.zeros(0)
+
+        ordered = self.sort(*keys)
+        change = np.zeros(len(ordered), dtype=np.bool_)
+        change[0] = True
+        for k in keys:
+            change[1:] |= ordered[k][1:] != ordered[k][:-1]
+        starts = np.flatnonzero(change)
+        sizes = np.diff(np.append(starts, len(ordered)))
+
+        values = ordered[column]
+        if how == "sum":
+            agg = np.add.reduceat(values, starts)
+        elif how == "mean":
+            agg = np.add.reduceat(values, starts) / sizes
+        elif how == "min":
+            agg = np.minimum.reduceat(values, starts)
+        elif how == "max":
+            agg = np.maximum.reduceat(values, starts)
+        elif how == "count":
+            agg = sizes
+        else:
+            raise ValueError(f"Unknown aggregate {how}")
+        return {k: ordered[k][starts] for k in keys}, agg
+
+
+def load(db, machine_name):
+    """
+    Table of every indexed iperf3 result for a machine, in index order (kernel, then file).
+    """
+    rows = resultdb.iperf_tests(db, machine_name)
+    return ResultTable({name: [row[name] for row in rows] for name in COLUMN_TYPES})
+
+
+def mt_cube(table, keys, column):
+    """
+    Lay out multithreaded results as a masked array with a row for each combination of keys
+    (e.g. kernel, bw) and a column for each thread. Cells for threads that didn't run (or whose
+    result is missing) are masked. Repeated runs of a thread are averaged.
+    Returns (key name -> array of key values for each row, thread numbers, masked array).
+    """
+    if len(table) == 0:
+        return {k: table[k][:0] for k in keys}, table["thread"][:0], np.ma.masked_all((0, 0))
+
+    groups, rows = np.unique(np.rec.fromarrays([table[k] for k in keys], names=list(keys)),
+                             return_inverse=True)
+    threads, cols = np.unique(table["thread"], return_inverse=True)
+    total = np.zeros((len(groups), len(threads)))
+    runs = np.zeros((len(groups), len(threads)))
+    np.add.at(total, (rows, cols), table[column])
+    np.add.at(runs, (rows, cols), 1)
+
+    data = np.ma.masked_array(total / np.maximum(runs, 1), mask=(runs == 0))
+    return {k: np.asarray(groups[k]) for k in keys}, threads, data
+
+
+def mt_aggregate(table, keys, column, how="sum"):
+    """
+    Combine multithreaded results across threads for each combination of keys, in one pass over
+    the whole table. how is one of:
+        sum, mean, min, max - over the threads that ran
+        count               - number of threads that ran
+        pNN                 - NNth percentile over the threads that ran, e.g. p50, p95
+        threads             - no combining, the per-thread breakdown
+    Returns (key name -> array of key values for each group, masked array of results). Groups
+    where no thread ran are masked.
+    """
+    groups, threads, data = mt_cube(table, keys, column)
+    if how == "threads":
+        return groups, data
+    if how == "sum":
+        out = data.sum(axis=1)
+    elif how == "mean":
+        out = data.mean(axis=1)
+    elif how == "min":
+        out = data.min(axis=1)
+    elif how == "max":
+        out = data.max(axis=1)
+    elif how == "count":
+        out = np.ma.masked_equal(data.count(axis=1), 0)
+    elif how.startswith("p"):
+        ran = data.count(axis=1) > 0
+        values = np.full(len(data), np.nan)
+        if ran.any():
+            values[ran] = np.nanpercentile(data[ran].filled(np.nan), float(how[1:]), axis=1)
+        out = np.ma.masked_array(values, mask=~ran)
+    else:
+        raise ValueError(f"Unknown aggregate {how}")
+    return groups, np.ma.masked_array(out, mask=np.ma.getmaskarray(out) | (data.count(axis=1) == 0))
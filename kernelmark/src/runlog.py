@@ -0,0 +1,199 @@
+# runlog
+#   Streaming parser for runbench logs. Reads a log line by line, optionally following it while
+#   runbench is still writing, drops the [unmarshall] chatter and turns each result row into a
+#   record tagged with the requested BPS, packet size and number of clients. Records go straight
+#   into the result database (see resultdb) in batches, so memory stays bounded however long
+#   the log. Many logs can be parsed at once, one per process.
+# 10/2026
+
+import os
+import re
+import sys
+import time
+from multiprocessing import Pool
+
+import ipbenchdata
+import resultdb
+
+BATCH = 500             # records written per transaction
+POLL_INTERVAL = 0.5     # seconds between checks of a followed log
+IDLE_TIMEOUT = 300      # seconds a followed log may go without growing before giving up
+
+STARTED = re.compile(r"^(\d+) test started!$")
+CLIENTS = "Using VBs numbers:"
+PKTSIZES = "Testing packets of"
+
+
+class LogParser():
+    """
+    Turns runbench log lines into records: dicts of the ipbench columns (see ipbenchdata) plus
+    bps (the requested rate per client), pktsize and clients. Tags not known from the log are None.
+    """
+    def __init__(self):
+        self.columns = ipbenchdata.COLUMNS
+        self.bps = None
+        self.clients = None
+        self.pktsizes = []
+
+    def feed(self, line):
+        """
+        Take one line. Returns a record if it was a result row, otherwise None.
+        """
+        if "[unmarshall]" in line:
+            return None
+        line = line.strip()
+
+        started = STARTED.match(line)
+        if started:
+            self.bps = int(started.group(1))
+            return None
+        if ipbenchdata.ROW.match(line):
+            return self.record(line)
+
+        if line.startswith(CLIENTS):
+            self.clients = len(line[len(CLIENTS):].split())
+        elif line.startswith(PKTSIZES):
+            self.pktsizes = [int(p) for p in line[len(PKTSIZES):].split() if p.isdigit()]
+        elif "hroughput" in line and "," in line:
+            columns = ipbenchdata.parse_header(line)
+            if len(columns) > 1:
+                self.columns = columns
+        return None
+
+    def record(self, line):
+        values = line.split(",")
+        if len(values) != len(self.columns):
+            return None
+        out = {}
+        for name, value in zip(self.columns, values):
+            try:
+                out[name] = float(value) if name in ipbenchdata.FLOAT_COLUMNS else int(float(value))
+            except ValueError:
+                return None
+
+        out["bps"] = self.bps
+        if out["bps"] is None:
+            out["bps"] = out.get("Requested-throughput")
+        out["pktsize"] = out.get("Sent-size")
+        if out["pktsize"] is None and len(self.pktsizes) == 1:
+            out["pktsize"] = self.pktsizes[0]
+        out["clients"] = self.clients
+        return out
+
+
+def records(lines):
+    """
+    Records from an iterable of log lines.
+    """
+    parser = LogParser()
+    for line in lines:
+        r = parser.feed(line)
+        if r is not None:
+            yield r
+
+
+def follow(path, done=None, idle_timeout=IDLE_TIMEOUT):
+    """
+    Lines of a log as they are written. Stops once done() is true (e.g. the writer exited) and the
+    whole log has been read, or when the log hasn't grown for idle_timeout seconds.
+    """
+    while not os.path.exists(path):
+        if done is not None and done():
+            return
+        time.sleep(POLL_INTERVAL)
+
+    with open(path) as f:
+        partial = ""
+        idle_since = time.time()
+        while True:
+            line = f.readline()
+            if line.endswith("\n"):
+                yield partial + line
+                partial = ""
+                idle_since = time.time()
+                continue
+            partial += line
+            if line != "":
+                idle_since = time.time()
+
+            finished = done is not None and done()
+            if finished or time.time() - idle_since > idle_timeout:
+                # one last look for anything written before the writer finished
+                partial += f.read()
+                if partial != "":
+                    yield partial
+                return
+            time.sleep(POLL_INTERVAL)
+
+
+def ingest_log(out_dir, machine_name, kernel, path, following=False, done=None):
+    """
+    Parse a runbench log into the result database for machine_name/kernel, replacing anything
+    stored from it before. If following, keep reading as the log is written (see follow).
+    Returns the number of records stored.
+    """
+    key = os.path.relpath(os.path.abspath(path), os.path.abspath(out_dir))
+    if following:
+        # the log may not have been created yet
+        lines = follow(path, done)
+    else:
+        lines = open(path)
+
+    db = resultdb.connect(out_dir)
+    db.execute("DELETE FROM ipbench WHERE path = ?", (key,))
+    db.commit()
+    count = 0
+    batch = []
+    for r in records(lines):
+        batch.append(r)
+        # when following, store each point as it comes in
+        if len(batch) >= BATCH or following:
+            resultdb.add_ipbench(db, key, machine_name, kernel, batch, count)
+            db.commit()
+            count += len(batch)
+            batch = []
+    resultdb.add_ipbench(db, key, machine_name, kernel, batch, count)
+    db.commit()
+    count += len(batch)
+    db.close()
+    if not following:
+        lines.close()
+    print(f"{machine_name} {kernel}: {count} ipbench results from {path}")
+    return count
+
+
+def ingest_logs(out_dir, machine_name, logs, following=False, workers=None):
+    """
+    Parse many logs in parallel. logs is a list of (kernel, path). Followed logs each need their
+    own worker, so all of them are started at once.
+    """
+    if logs == []:
+        return []
+    if workers is None:
+        workers = os.cpu_count()
+    if following:
+        workers = len(logs)
+    with Pool(min(workers, len(logs))) as pool:
+        return pool.starmap(ingest_log, [(out_dir, machine_name, kernel, path, following)
+                                         for kernel, path in logs])
+
+
+def usage():
+    print("USAGE: runlog.py [machine] [kernel=logfile] ... [follow]")
+    print(" Parses runbench logs into the result database in the output dir.")
+    exit()
+
+
+if __name__ == "__main__":
+    from build import out_dir
+    if len(sys.argv) < 3:
+        usage()
+    following = "follow" in sys.argv
+    logs = []
+    for arg in sys.argv[2:]:
+        if arg == "follow":
+            continue
+        if "=" not in arg:
+            usage()
+        logs.append(tuple(arg.split("=", 1)))
+    ingest_logs(out_dir, sys.argv[1], logs, following)
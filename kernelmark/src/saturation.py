@@ -0,0 +1,71 @@
+# saturation
+#   Adaptive rate sweeps. Rather than running every rate on a fixed grid, bracket the saturation
+#   point - the rate at which achieved throughput stops keeping up with requested - by bisection,
+#   then spend the remaining runs close around it. Far from the knee the curve is a straight line
+#   (or flat) and a few points show it; near the knee is where the resolution is needed.
+# 10/2026
+
+KNEE_RATIO = 0.95   # achieved/requested below this is saturated
+RESOLUTION = 0.05   # stop bisecting once the knee is bracketed to this fraction of the range
+DENSE_POINTS = 4    # extra runs around the knee once it's found
+
+
+def search(measure, lo, hi, step=1, resolution=None, dense=DENSE_POINTS, ratio=KNEE_RATIO):
+    """
+    Find where a test saturates between rates lo and hi. measure(rate) runs one test and returns
+    the fraction of the requested rate it achieved, or None if it failed (counted as saturated).
+    Rates are rounded to multiples of step and no rate is run twice.
+    Returns (knee, dict of rate -> fraction achieved) where knee is the highest rate that kept up,
+    hi if nothing saturated, or None if even lo was saturated.
+    """
+    if resolution is None:
+        resolution = max((hi - lo) * RESOLUTION, step)
+    results = {}
+
+    def at(rate):
+        rate = min(max(int(round(rate / step)) * step, lo), hi)
+        if rate not in results:
+            results[rate] = measure(rate)
+        return rate
+
+    def ok(rate):
+        r = results[at(rate)]
+        return r is not None and r >= ratio
+
+    # Bracket. Both ends are always run so there's a curve to draw.
+    at(lo)
+    if ok(hi):
+        print(f"No saturation up to {hi} after {len(results)} runs")
+        return hi, results
+    if not ok(lo):
+        print(f"Saturated already at {lo} after {len(results)} runs")
+        return None, results
+
+    # Bisect
+    good, bad = lo, hi
+    while bad - good > resolution:
+        mid = at((good + bad) / 2)
+        if mid in (good, bad):
+            break
+        if ok(mid):
+            good = mid
+        else:
+            bad = mid
+
+    # Fill in around the knee
+    spacing = max(bad - good, step)
+    centre = (good + bad) / 2
+    offsets = []
+    for k in range(1, dense + 1):
+        offsets += [k * spacing, -k * spacing]
+    added = 0
+    for offset in offsets:
+        if added == dense:
+            break
+        rate = min(max(int(round((centre + offset) / step)) * step, lo), hi)
+        if all(abs(rate - r) >= spacing / 2 for r in results):
+            at(rate)
+            added += 1
+
+    print(f"Saturates between {good} and {bad} after {len(results)} runs")
+    return good, results
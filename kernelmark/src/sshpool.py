@@ -0,0 +1,137 @@
+# sshpool
+#   Persistent connections to the load generators. Commands and file transfers to a host share one
+#   multiplexed, kept alive SSH connection (OpenSSH ControlMaster) instead of a new handshake each.
+#   LocalTransport is a stand in with the same interface which runs everything on this machine,
+#   so the test stage can be exercised without the lab.
+# 10/2026
+
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+
+CONTROL_PERSIST = 600   # seconds an idle master connection is kept open
+KEEPALIVE = 15          # seconds between keepalives on a master connection
+
+
+class SSHTransport():
+    def __init__(self):
+        self.control_dir = tempfile.mkdtemp(prefix="kernelmark-ssh-")
+        self.hosts = set()
+
+    def options(self):
+        return [
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={self.control_dir}/%C",
+            "-o", f"ControlPersist={CONTROL_PERSIST}",
+            "-o", f"ServerAliveInterval={KEEPALIVE}",
+            "-o", "BatchMode=yes"
+        ]
+
+    def command(self, host, cmd):
+        self.hosts.add(host)
+        return ["ssh"] + self.options() + [host, cmd]
+
+    def fetch_command(self, host, remote, local):
+        self.hosts.add(host)
+        return ["scp", "-q"] + self.options() + [f"{host}:{remote}", local]
+
+    def run(self, host, cmd):
+        """
+        Run cmd on host. Returns its exit code.
+        """
+        return subprocess.run(self.command(host, cmd)).returncode
+
+    def fetch(self, host, remote, local):
+        """
+        Copy remote file from host to local path. Returns the exit code.
+        """
+        return subprocess.run(self.fetch_command(host, remote, local)).returncode
+
+    async def start_async(self, host, cmd, stdout=None):
+        """
+        Start cmd on host without waiting for it. Returns the process.
+        """
+        return await asyncio.create_subprocess_exec(*self.command(host, cmd), stdout=stdout)
+
+    async def run_async(self, host, cmd):
+        proc = await self.start_async(host, cmd)
+        return await proc.wait()
+
+    async def fetch_async(self, host, remote, local):
+        proc = await asyncio.create_subprocess_exec(*self.fetch_command(host, remote, local))
+        return await proc.wait()
+
+    def connect(self, hosts):
+        """
+        Open master connections to hosts in parallel ahead of time.
+        """
+        async def connect_all():
+            return await asyncio.gather(*[self.run_async(h, "true") for h in hosts])
+        for host, code in zip(hosts, asyncio.run(connect_all())):
+            if code != 0:
+                print(f"WARNING: couldn't connect to {host}")
+
+    def close(self):
+        """
+        Shut down all master connections.
+        """
+        for host in self.hosts:
+            subprocess.run(["ssh"] + self.options() + ["-O", "exit", host],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.hosts = set()
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+
+
+class LocalTransport():
+    """
+    Runs "remote" commands on this machine. Each host gets its own directory standing in for its
+    /tmp, so concurrent clients don't trample each other's files.
+    """
+    def __init__(self):
+        self.root_dir = tempfile.mkdtemp(prefix="kernelmark-local-")
+
+    def root(self, host):
+        path = f"{self.root_dir}/{host}"
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def localise(self, host, path):
+        return path.replace("/tmp/", f"{self.root(host)}/")
+
+    def command(self, host, cmd):
+        return ["sh", "-c", self.localise(host, cmd)]
+
+    def run(self, host, cmd):
+        return subprocess.run(self.command(host, cmd)).returncode
+
+    def fetch(self, host, remote, local):
+        try:
+            shutil.copyfile(self.localise(host, remote), local)
+            return 0
+        except OSError as e:
+            print(f"Local fetch from {host} failed: {e}")
+            return 1
+
+    async def start_async(self, host, cmd, stdout=None):
+        return await asyncio.create_subprocess_exec(*self.command(host, cmd), stdout=stdout)
+
+    async def run_async(self, host, cmd):
+        proc = await self.start_async(host, cmd)
+        return await proc.wait()
+
+    async def fetch_async(self, host, remote, local):
+        return self.fetch(host, remote, local)
+
+    def connect(self, hosts):
+        pass
+
+    def close(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+
+def transport(local):
+    if local:
+        return LocalTransport()
+    return SSHTransport()
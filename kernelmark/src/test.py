@@ -6,14 +6,27 @@
 
 import json
 import os
-import socket
+import sys
 import time
 import signal
+import asyncio
+import readiness
+import orchestrate
+import sshpool
+import generators
+import collector
+import runlog
+import resultdb
+import ipbenchctl
+import saturation
+import earlystop
+import subprocess
+import traceback
+from collector import ResultCollector
 from build import out_dir
 from error import *
 from machine import Machine
 
-MAX_RETRIES = 40
 TARGET_BW = 1000  # in megabits / sec
 IPERF_PORT1 = 5000
 
@@ -35,6 +48,26 @@ bws = [
 
 MAX_CPUS = 8
 
+# Rate granularity of adaptive sweeps (see saturation)
+ADAPTIVE_BW_STEP = 10               # Mbit/s
+ADAPTIVE_BWPEAK_STEP = 10000000     # bit/s
+# ipbench columns checked against the requested rate when looking for saturation
+SATURATION_KEYS = ["Achieved-throughput-sent", "Achieved-throughput-received"]
+
+# Fixed sleeps around tests that sequencing replaced, used to report time saved
+SINGLE_SLEEP_BEFORE = 5
+SINGLE_SLEEP_AFTER = 3
+MULTI_SLEEP_BEFORE = 5
+MULTI_SLEEP_AFTER = 5
+
+# Length of an iperf3 run in seconds. Stopping early runs it in earlystop.SEGMENT long segments.
+TEST_DURATION = 50
+
+sequencer = readiness.Sequencer()
+transport = None    # connections to the load generators, see sshpool
+json_stream = False # stream interval records back with --json-stream (iperf3 3.17+)
+early_stop = None   # precision at which iperf3 runs stop early (see earlystop), None to run in full
+
 
 def test(machine, kernel_ver, local, test_args):
     if __name__ != "__main__":
@@ -43,110 +76,226 @@ def test(machine, kernel_ver, local, test_args):
         pid = 0
 
     if pid == 0:
-        # Child process
-        # Start by waiting until the system is booted by trying to send
-        # a UDP packet to port 1345 until it succeeds.
-        if __name__ != "__main__":
-            print("Waiting for system to boot...")
-            buff_sz = 1000
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.bind((str(socket.INADDR_ANY), 1345))
-            sock.settimeout(10.0)
-            retries = 0
-
-            while True:
-                if retries > MAX_RETRIES:
-                    print(
-                        f"Tester thread failed to connect to {machine.name} on kernel {kernel_ver}")
-                    exit()
-                try:
-                    sock.sendto(b"Emu", (machine.ip, 1345))
-                    out = sock.recvfrom(buff_sz)[0]
-                    print(str(out))
-                    if out != b'Emu':
-                        print("Incorrect packet returned!")
-                        time.sleep(5)
-                        retries += 1
-                        continue
-                    else:
-                        print("Server found")
-                        break
-
-                except socket.error as e:
-                    # print(f"Failed! {e}")
-                    retries += 1
-                    time.sleep(5)
-                    continue
-            print("Server ready!")
-            sock.close()
-
-            # Server is ready. Wait again to give iperf time to start
-            time.sleep(5)
-
-        # ipbench is cooked, so skip that part and just do iperf3 for now
-
-        # Invoke iperf3
-        dirs = []
-        if "bidir" in test_args:
-            dirs.append("bidir")
-        if "unidir" in test_args:
-            dirs.append("unidir")
-
-        # Run for each direction
-        for d in dirs:
-            bidir = (d == "bidir")
-            if "iperf-bw" in test_args:
-                for bw in bws:
-                    # TCP 100% bw
-                    iperf3_test_single(machine, kernel_ver, MAX_PKT_SZ, bw, False, local, bidir)
-
-                    # UDP 100% bw
-                    iperf3_test_single(machine, kernel_ver, MAX_PKT_SZ, bw, True, local, bidir)
-                    
-                    # TCP multicore
-                    iperf3_test_multi(machine, kernel_ver, MAX_PKT_SZ, bw, False, machine.logical_cpus, bidir)
-
-                    # UDP multicore
-                    iperf3_test_multi(machine, kernel_ver, MAX_PKT_SZ, bw, True, machine.logical_cpus, bidir)
-
-            if "iperf-pktsize" in test_args:
-                for sz in pkt_sizes:
-                    # TCP 100% bw
-                    iperf3_test_single(machine, kernel_ver, sz, TARGET_BW, False, local, bidir)
-
-                    # UDP 100% bw
-                    iperf3_test_single(machine, kernel_ver, sz, TARGET_BW, True, local, bidir)
-                        
-                    # TCP multicore
-                    iperf3_test_multi(machine, kernel_ver, sz, TARGET_BW, False, machine.logical_cpus, bidir)
-
-                    # UDP multicore
-                    iperf3_test_multi(machine, kernel_ver, sz, TARGET_BW, True, machine.logical_cpus, bidir)
-
-        if "ipbench" in test_args:    
-            # Invoke ipbench tests
-            os.system(f"../../runbench/runbenchnocpu > {kernel_ver}-{machine.name}")
-            os.system(f"../../runbench/stopbench")
-            time.sleep(5)
-            print(f"Done testing.")
-            exit(0)
+        # Child process. The tester is forked, so it must never return or raise into the caller's
+        # loop (or run its cleanup, which may set events shared with other processes).
+        status = 0
+        try:
+            run_tests(machine, kernel_ver, local, test_args)
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
     return pid
 
 
+def run_tests(machine, kernel_ver, local, test_args):
+    """
+    Wait for the target to boot, then run every test in test_args.
+    """
+    # Start by waiting until the system is booted and iperf3 servers are up.
+    if __name__ != "__main__":
+        print("Waiting for system to boot...")
+        ports = [IPERF_PORT1 + i for i in range(min(machine.logical_cpus, MAX_CPUS))]
+        if not readiness.wait_for_target(machine, ports):
+            print(f"Tester thread failed to connect to {machine.name} on kernel {kernel_ver}")
+            return
+
+    # Keep connections to the load generators open for the whole run
+    global transport, json_stream, early_stop
+    transport = sshpool.transport("localtransport" in test_args)
+    json_stream = "json-stream" in test_args
+    # early-stop[=PCT] - stopping early needs the intervals streamed back
+    for a in test_args:
+        if a == "early-stop":
+            early_stop = earlystop.TARGET
+        elif a.startswith("early-stop="):
+            early_stop = float(a.split("=")[1]) / 100
+    if early_stop is not None:
+        json_stream = True
+    transport.connect(generators.HOSTS)
+
+    # ipbench is cooked, so skip that part and just do iperf3 for now
+
+    # Invoke iperf3
+    dirs = []
+    if "bidir" in test_args:
+        dirs.append("bidir")
+    if "unidir" in test_args:
+        dirs.append("unidir")
+
+    # Run for each direction
+    for d in dirs:
+        bidir = (d == "bidir")
+        if "iperf-bw" in test_args and "adaptive" in test_args:
+            iperf3_adaptive_bw(machine, kernel_ver, local, bidir)
+        elif "iperf-bw" in test_args:
+            for bw in bws:
+                # TCP 100% bw
+                iperf3_test_single(machine, kernel_ver, MAX_PKT_SZ, bw, False, local, bidir)
+
+                # UDP 100% bw
+                iperf3_test_single(machine, kernel_ver, MAX_PKT_SZ, bw, True, local, bidir)
+                
+                # TCP multicore
+                iperf3_test_multi(machine, kernel_ver, MAX_PKT_SZ, bw, False, machine.logical_cpus, bidir)
+
+                # UDP multicore
+                iperf3_test_multi(machine, kernel_ver, MAX_PKT_SZ, bw, True, machine.logical_cpus, bidir)
+
+        if "iperf-pktsize" in test_args:
+            for sz in pkt_sizes:
+                # TCP 100% bw
+                iperf3_test_single(machine, kernel_ver, sz, TARGET_BW, False, local, bidir)
+
+                # UDP 100% bw
+                iperf3_test_single(machine, kernel_ver, sz, TARGET_BW, True, local, bidir)
+                    
+                # TCP multicore
+                iperf3_test_multi(machine, kernel_ver, sz, TARGET_BW, False, machine.logical_cpus, bidir)
+
+                # UDP multicore
+                iperf3_test_multi(machine, kernel_ver, sz, TARGET_BW, True, machine.logical_cpus, bidir)
+
+    sequencer.report()
+    transport.close()
+
+    if "ipbench" in test_args:    
+        # Invoke ipbench tests - the sweep drives every load generator it is given
+        with generators.lease(len(generators.HOSTS), machine.ip, num_ports=0) as l:
+            if l is not None:
+                log = f"{out_dir}/{machine.name}/{kernel_ver}/ipbench_result"
+                if "runbench" in test_args:
+                    ipbench_runbench(machine, kernel_ver, l.hosts, log)
+                else:
+                    ipbench_sweep(machine, kernel_ver, l.hosts, log, "adaptive" in test_args)
+        time.sleep(5)
+    print(f"Done testing.")
+
+
+
+def ipbench_sweep(machine, kernel_ver, hosts, log, adaptive=False):
+    """
+    Run the ipbench sweep in this process, storing each point in the result database as it
+    completes. If adaptive, search out each packet size's saturation point (see saturation)
+    instead of running every BWPEAK. Falls back to runbench without the ipbench bindings.
+    """
+    # the previous result is only replaced once we know we can run
+    try:
+        controller = ipbenchctl.Controller(hosts, machine.ip)
+    except ImportError as e:
+        print(f"ipbench bindings not available ({e}). Running runbench instead.")
+        ipbench_runbench(machine, kernel_ver, hosts, log)
+        return
+
+    db = resultdb.connect(out_dir)
+    key = os.path.relpath(log, out_dir)
+    db.execute("DELETE FROM ipbench WHERE path = ?", (key,))
+    db.commit()
+    count = 0
+
+    def store(r):
+        nonlocal count
+        resultdb.add_ipbench(db, key, machine.name, kernel_ver, [r], count)
+        db.commit()
+        count += 1
+
+    with open(log, "w") as f:
+        controller.begin(f)
+        if adaptive:
+            controller.emit(f"Testing packets of  {' '.join(str(p) for p in ipbenchctl.PKTSIZES)}\n")
+            for pktsize in ipbenchctl.PKTSIZES:
+                def measure(bwpeak):
+                    r = controller.measure(bwpeak, pktsize)
+                    if r is None:
+                        return None
+                    store(r)
+                    # received keeps up with requested well past the knee - it's sent that falls behind
+                    achieved = min(r[k] for k in SATURATION_KEYS if k in r)
+                    return achieved / r["Requested-throughput"]
+                saturation.search(measure, min(ipbenchctl.BWPEAKS), max(ipbenchctl.BWPEAKS),
+                                  step=ADAPTIVE_BWPEAK_STEP)
+        else:
+            for r in controller.sweep():
+                store(r)
+    db.close()
+    print(f"{machine.name} {kernel_ver}: {count} ipbench results")
+
+
+def ipbench_runbench(machine, kernel_ver, hosts, log):
+    """
+    Run the ipbench sweep with the runbench script, parsing its log into the result database as
+    it is written.
+    """
+    tinnies = " ".join(h.split(".")[0][2:] for h in hosts)
+    with open(log, "w") as f:
+        bench = subprocess.Popen("../../runbench/runbenchnocpu", shell=True, stdout=f,
+                                 env=dict(os.environ, TINNIES=tinnies))
+        runlog.ingest_log(out_dir, machine.name, kernel_ver, log, following=True,
+                          done=lambda: bench.poll() is not None)
+    os.system(f"../../runbench/stopbench")
+
+
+def iperf3_adaptive_bw(machine, kernel_ver, local, bidir):
+    """
+    Bandwidth sweep which searches out where each kind of test saturates (see saturation)
+    between the lowest and highest of bws, instead of running all of them.
+    """
+    for udp in [False, True]:
+        def single(bw):
+            return achieved(iperf3_test_single(machine, kernel_ver, MAX_PKT_SZ, bw, udp, local, bidir), bw)
+        saturation.search(single, min(bws), max(bws), step=ADAPTIVE_BW_STEP)
+    for udp in [False, True]:
+        def multi(bw):
+            # each thread is asked for a whole number of Mbit/s, so for a little less than bw in total
+            requested = int(bw / machine.logical_cpus) * machine.logical_cpus
+            return achieved(iperf3_test_multi(machine, kernel_ver, MAX_PKT_SZ, bw, udp, machine.logical_cpus, bidir),
+                            requested)
+        saturation.search(multi, min(bws), max(bws), step=ADAPTIVE_BW_STEP)
+
+
+def achieved(results, bw):
+    """
+    Fraction of bw (Mbit/s, the total iperf3 was asked for) achieved by a test, given its result
+    file or files (one per thread). None if it didn't run.
+    """
+    if results is None:
+        return None
+    if isinstance(results, str):
+        results = [results]
+    total = 0.0
+    for f in results:
+        try:
+            end, num_intervals = resultdb.summary(f)
+            if num_intervals == 0:
+                return None
+            # what got through, where iperf3 reports it
+            total += end.get("sum_received", end["sum_sent"])["bits_per_second"] / (10**6)
+        except (OSError, ValueError, KeyError):
+            return None
+    return total / bw
+
 
 def iperf3_test_single(machine, kernel_ver, pkt_size, bw, udp, local, bidir):
     """
     Run an iperf3 test in a one-one test - one client and one server both single threaded.
     NOTE: if not using this with the local flag, it will not work outside of the TS network.
+    Returns the result file, or None if the test couldn't be run.
     """
-    time.sleep(5)
     print(f"Testing {machine.ip} - {pkt_size} bytes - {bw}")
-    iperf_common = f"-c {machine.ip} -t 50 -J --connect-timeout 5000 -p 5000"
+    seconds = TEST_DURATION
+    if early_stop is not None and not local:
+        seconds = earlystop.SEGMENT
+    iperf_common = f"-c {machine.ip} -t {seconds} -J --connect-timeout 5000"
     if bidir:
         iperf_common += " --bidir"
 
     f = ""
     if local:
+        sequencer.before(machine.ip, [IPERF_PORT1], SINGLE_SLEEP_BEFORE)
+        iperf_common += f" -p {IPERF_PORT1}"
         if udp:
             f = logfile(machine, kernel_ver, f"iperf3-local-udp-{bw}m-{pkt_size}")
             os.system(f"iperf3 {iperf_common} -b {bw}M -u --logfile {f} --length {pkt_size}")
@@ -155,7 +304,7 @@ def iperf3_test_single(machine, kernel_ver, pkt_size, bw, udp, local, bidir):
             os.system(f"iperf3 {iperf_common} -b {bw}M --logfile {f} --set-mss {pkt_size}")
         print(f"Local test {f} done.")
     else:
-        # for each of these: run command on vb01, scp logfile back
+        # for each of these: run command on a leased load generator, stream results back
         p = "tcp"
         if udp:
             p = "udp"
@@ -163,47 +312,75 @@ def iperf3_test_single(machine, kernel_ver, pkt_size, bw, udp, local, bidir):
         if bidir:
             p += ".bidir"
         
-        os.system(f"on -h vb01.keg.cse.unsw.edu.au -c 'rm -f /tmp/iperf3-log && iperf3 {iperf_common} -b {bw}M --logfile /tmp/iperf3-log --length {pkt_size}' && \
-            scp vb01.keg.cse.unsw.edu.au:/tmp/iperf3-log {out_dir}/{machine.name}/{kernel_ver}/iperf3-st-{p}-{bw}m-{pkt_size}.test")
+        if json_stream:
+            iperf_common += " --json-stream"
+
+        # results stream back over the control connection
+        f = f"{out_dir}/{machine.name}/{kernel_ver}/iperf3-st-{p}-{bw}m-{pkt_size}.test"
+        with generators.lease(1, machine.ip) as l:
+            if l is None:
+                print(f"Skipping test {pkt_size}-{bw}-{p} - no load generator.")
+                return
+            sequencer.before(machine.ip, l.ports, SINGLE_SLEEP_BEFORE)
+            monitor = None
+            if early_stop is not None:
+                monitor = earlystop.Monitor(1, early_stop, TEST_DURATION)
+            asyncio.run(collector.run(transport, l.hosts[0],
+                                      f"iperf3 {iperf_common} -p {l.ports[0]} -b {bw}M --length {pkt_size}",
+                                      ResultCollector(f, json_stream, f"st-{p}-{bw}m-{pkt_size}", monitor),
+                                      lambda: readiness.wait_servers_idle(machine.ip, l.ports)))
         print(f"Test {pkt_size}-{bw}-udp complete.\n")
         
-    time.sleep(3)
+    sequencer.after([f], SINGLE_SLEEP_AFTER)
+    return f
 
 def iperf3_test_multi(machine, kernel_ver, pkt_size, bw, udp, num_cpus, bidir):
     """
-    Run multicore tests on num_cpus.
+    Run multicore tests on num_cpus. Returns the result files, one per core, or None if the
+    tests couldn't be run.
     """
-    time.sleep(5)  
     print(f"Multicore testing {machine.ip} - {pkt_size} bytes - {bw}")
     if num_cpus > MAX_CPUS:
         print(f"Tried to test with too many cores! Max={MAX_CPUS} Requested={num_cpus}.")
     
-    iperf_common = f"-c {machine.ip} -t 50 -J --connect-timeout 5000 -b {int(bw/num_cpus)}M --length {pkt_size} --bidir"
+    seconds = TEST_DURATION
+    if early_stop is not None:
+        seconds = earlystop.SEGMENT
+    iperf_common = f"-c {machine.ip} -t {seconds} -J --connect-timeout 5000 -b {int(bw/num_cpus)}M --length {pkt_size} --bidir"
     if udp:
         iperf_common += " -u"
     if bidir:
         iperf_common += " --bidir"
+    if json_stream:
+        iperf_common += " --json-stream"
     
-    # spin up testers 2..8
-    for i in range(1, num_cpus + 1):
-        os.system(f"on -h vb0{str(i+1)}.keg.cse.unsw.edu.au -c 'rm -f /tmp/mtlog && iperf3 {iperf_common} -p {str(5000 + i)} --logfile /tmp/mtlog' &")
-    
-    # tester 1
-    os.system(f"on -h vb01.keg.cse.unsw.edu.au -c 'rm -f ~/iperf3/vb01/log && iperf3 {iperf_common} -p 5000 --logfile ~/iperf3/vb01/log'")
+    p = "tcp"
+    if udp:
+        p = "udp"
+    if bidir:
+        p += ".bidir"
 
-    # once tester 1 unblocks, we can collect results and move on. wait, just in case.
-    time.sleep(5)
+    # one load generator per core, all started together
+    with generators.lease(num_cpus, machine.ip) as l:
+        if l is None:
+            print(f"Skipping multicore test {pkt_size}-{bw}-{p} - not enough load generators.")
+            return
+        sequencer.before(machine.ip, l.ports, MULTI_SLEEP_BEFORE)
 
-    for i in range(0, num_cpus):
-        print(f"Getting info from vb0{str(i+1)}")
-        p = "tcp"
-        if udp:
-            p = "udp"
-        if bidir:
-            p += ".bidir"
-        
-        os.system(f"scp vb0{str(i+1)}.keg.cse.unsw.edu.au:/tmp/mtlog {out_dir}/{machine.name}/{kernel_ver}/iperf3-mt{i}-{p}-{bw}m-{pkt_size}.test")
-    return
+        clients = []
+        for i in range(0, num_cpus):
+            clients.append((l.hosts[i], f"{iperf_common} -p {l.ports[i]}",
+                            f"{out_dir}/{machine.name}/{kernel_ver}/iperf3-mt{i}-{p}-{bw}m-{pkt_size}.test"))
+        skew_file = f"{out_dir}/{machine.name}/{kernel_ver}/iperf3-mt-{p}-{bw}m-{pkt_size}.skew"
+        monitor = None
+        if early_stop is not None:
+            monitor = earlystop.Monitor(num_cpus, early_stop, TEST_DURATION)
+        asyncio.run(orchestrate.run_multi(transport, clients, json_stream, skew_file, monitor,
+                                          lambda: readiness.wait_servers_idle(machine.ip, l.ports)))
+
+    results = [path for _, _, path in clients]
+    sequencer.after(results, MULTI_SLEEP_AFTER)
+    return results
 
 def logfile(machine, kernel_ver, title):
     if os.path.exists(f"{out_dir}/{machine.name}/{kernel_ver}/{title}.test"):
@@ -218,7 +395,6 @@ def tests_exist(machine, kernel_ver):
 
 # Test test for standalone testing of this test
 if __name__ == "__main__":
-    import sys
     from kernelmark import DEFAULT_TESTFLAGS
     if len(sys.argv) != 2:
         print("USAGE: test.py [machine]")
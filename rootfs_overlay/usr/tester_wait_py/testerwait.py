@@ -11,16 +11,37 @@ import os
 import socket
 import time
 
+PORT = 1345
+ANNOUNCE_INTERVAL = 1.0     # seconds between "ready" broadcasts while waiting for the tester
+
 
 def main():
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((str(socket.INADDR_ANY), 1345))
+    sock.bind((str(socket.INADDR_ANY), PORT))
+    sock.settimeout(ANNOUNCE_INTERVAL)
+
+    # Announce that we're up rather than waiting for the tester's next probe. Announcements go out
+    # from another port; the tester answers them on PORT like a normal probe.
+    announce = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    announce.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
 
     buff_sz = 1000
-    client = sock.recvfrom(buff_sz)[1]
+    while True:
+        try:
+            announce.sendto(str.encode("Emu"), ("<broadcast>", PORT))
+        except OSError:
+            pass
+        try:
+            client = sock.recvfrom(buff_sz)[1]
+        except socket.timeout:
+            continue
+        # Ignore our own announcements looping back - the tester always sends from PORT
+        if client[1] == PORT:
+            break
 
     sock.sendto(str.encode("Emu"), client)
     sock.close()
+    announce.close()
     exit(0)
 
 